@@ -0,0 +1,245 @@
+# -*- coding: utf-8 -*
+'''A qCSF estimator for many independent sessions at once, e.g. to simulate many observers
+
+	The posteriors of every session are stacked into a single (sessions, parameter combinations)
+	array, so selecting stimuli and updating posteriors are array operations over all sessions
+	rather than Python loops over separate `QuickCSFEstimator`s.
+'''
+
+import logging
+import math
+
+import numpy
+
+from . import QuickCSF
+
+logger = logging.getLogger(__name__)
+
+class BatchQuickCSFEstimator():
+	def __init__(self, sessionCount, stimulusSpace=None, d=0.5, sig=0.25, parameterSpace=None, posteriorDtype=numpy.float64,
+		sampleCount=100, chunkSize=16, randomSource=None
+	):
+		'''Create a new batch of QuickCSF estimators sharing the same input/output spaces
+
+			Args:
+				sessionCount: number of independent sessions
+				stimulusSpace: 2,x numpy array of attributes to be used for stimulus generation
+					numpy.array([contrasts, frequencies])
+				d: lapse parameter of the psychometric function (1-d is the guess rate)
+				sig: slope parameter of the psychometric function
+				parameterSpace: values of each parameter to be estimated, in (possibly fractional) index units,
+					see `QuickCSF.makeParameterSpace()`; defaults to the full-resolution grid
+				posteriorDtype: storage type of the log-posteriors (numpy.float32 halves their memory)
+				sampleCount: number of parameter samples drawn from each session's posterior to estimate
+					the information gain of every stimulus, as in QuickCSFEstimator's 'sampled' selection
+				chunkSize: number of sessions whose information gain is estimated at once, bounding the size of temporaries
+				randomSource: a numpy.random.Generator for reproducible stimulus selection; defaults to the numpy.random module
+		'''
+		if stimulusSpace is None:
+			stimulusSpace = [
+				QuickCSF.makeContrastSpace(.0001, .05),
+				QuickCSF.makeFrequencySpace()
+			]
+
+		if parameterSpace is None:
+			parameterSpace = QuickCSF.makeParameterSpace()
+
+		logger.info('Initializing BatchQuickCSFEstimator')
+		logger.debug(f'Initializing BatchQuickCSFEstimator sessionCount={sessionCount}')
+
+		self.sessionCount = sessionCount
+		self.stimulusSpace = stimulusSpace
+
+		self.stimulusRanges = [len(sSpace) for sSpace in self.stimulusSpace]
+		self.stimComboCount = numpy.prod(self.stimulusRanges)
+
+		self.d = d
+		self.sig = sig
+		self.sampleCount = sampleCount
+		self.chunkSize = chunkSize
+		self.random = numpy.random if randomSource is None else randomSource
+
+		self.parameterSpace = parameterSpace
+		self.parameterRanges = [len(pSpace) for pSpace in self.parameterSpace]
+		self.paramComboCount = numpy.prod(self.parameterRanges)
+
+		# The first parameter varies fastest in flattened indices
+		parameterIndices = numpy.unravel_index(numpy.arange(self.paramComboCount), self.parameterRanges, order='F')
+		mappedParameters = QuickCSF.mapCSFParams(numpy.stack(
+			[pSpace[indices] for pSpace, indices in zip(self.parameterSpace, parameterIndices)],
+			axis=1
+		))
+
+		# Log sensitivity of every parameter combination at every frequency, shared by all sessions
+		self.csfTable = QuickCSF.csf(*mappedParameters, self.stimulusSpace[1].reshape(1,-1))
+
+		# Unnormalized log-probabilities, one row per session
+		self.logPosterior = numpy.zeros((sessionCount, self.paramComboCount), dtype=posteriorDtype)
+
+		self.currentStimulusIndex = None
+		self.stimulusIndexHistory = []
+
+	def probabilities(self, sessions=slice(None)):
+		'''Normalized parameter probabilities of a slice of sessions as a (sessions, paramComboCount) float64 array'''
+
+		# Re-center on each session's peak (in place) so the stored values stay bounded over long sessions
+		logPosterior = self.logPosterior[sessions]
+		logPosterior -= logPosterior.max(axis=1, keepdims=True)
+
+		probabilities = numpy.exp(logPosterior.astype(numpy.float64))
+		probabilities /= probabilities.sum(axis=1, keepdims=True)
+
+		return probabilities
+
+	def next(self):
+		'''Determine the next stimulus to be tested in every session
+
+			Returns:
+				a Stimulus whose contrast and frequency are arrays with one value per session
+		'''
+
+		gain = self.informationGain()
+
+		# Select a random stimulus from the highest 10% info givers of each session
+		topCount = math.ceil(self.stimComboCount/10)
+		topIndices = numpy.argpartition(-gain, topCount-1, axis=1)[:,:topCount]
+		choices = (self.random.random(self.sessionCount)*topCount).astype(int)
+
+		self.currentStimulusIndex = topIndices[numpy.arange(self.sessionCount), choices]
+		stimulusIndices = self.inflateStimulusIndex(self.currentStimulusIndex)
+
+		return QuickCSF.Stimulus(
+			self.stimulusSpace[0][stimulusIndices[:,0]],
+			self.stimulusSpace[1][stimulusIndices[:,1]]
+		)
+
+	def _sampleParameters(self, sessions):
+		'''Draws `sampleCount` flattened parameter indices from each session's posterior, as a (sessions, sampleCount) array'''
+
+		cdf = numpy.cumsum(self.probabilities(sessions), axis=1)
+		cdf /= cdf[:,-1:]
+		cdf[:,-1] = 1
+
+		# Offset each session's cdf by its row so that one search over the flattened array covers every session
+		rows = numpy.arange(len(cdf))[:,numpy.newaxis]
+		cdf += rows
+		uniformSamples = self.random.random((len(cdf), self.sampleCount)) + rows
+
+		return cdf.reshape(-1).searchsorted(uniformSamples, side='right') - rows * self.paramComboCount
+
+	def informationGain(self):
+		'''Estimates the information gain of every stimulus for every session as a (sessionCount, stimComboCount) array'''
+
+		gain = numpy.empty((self.sessionCount, self.stimComboCount))
+		for start in range(0, self.sessionCount, self.chunkSize):
+			sessions = slice(start, min(start+self.chunkSize, self.sessionCount))
+			paramIndices = self._sampleParameters(sessions)
+
+			# (sessions, samples, frequencies, contrasts), then flattened with contrast varying fastest like stimulus indices
+			p = QuickCSF.psychometric(self.csfTable[paramIndices][...,numpy.newaxis], self.stimulusSpace[0], self.d, self.sig)
+			p = p.reshape(p.shape[0], p.shape[1], -1)
+
+			pbar = p.mean(axis=1)
+			hbar = QuickCSF.entropy(p).mean(axis=1)
+
+			gain[sessions] = QuickCSF.entropy(pbar)-hbar
+
+		return gain
+
+	def inflateStimulusIndex(self, stimulusIndex):
+		'''Converts flattened stimulus indices into their 2 constituent indices'''
+		return numpy.stack(numpy.unravel_index(numpy.reshape(stimulusIndex, -1), self.stimulusRanges, order='F'), axis=1)
+
+	def markResponse(self, responses, stimIndices=None):
+		'''Record every session's response and update its parameter probabilities
+
+			Args:
+				responses: one response per session
+				stimIndices: the flattened stimulus index tested in each session;
+					if not specified, will use the last stimuli generated by next()
+		'''
+
+		responses = numpy.reshape(responses, -1).astype(bool)
+		if stimIndices is None:
+			stimIndices = self.currentStimulusIndex
+		stimIndices = numpy.reshape(stimIndices, -1)
+
+		logger.debug(f'Marking {numpy.count_nonzero(responses)} of {len(responses)} responses correct')
+
+		self.stimulusIndexHistory.append((stimIndices.copy(), responses.copy()))
+
+		# Each distinct stimulus is only evaluated once, however many sessions tested it, and one at a time so that
+		# no temporary holds more than a column of the CSF table. Its log-likelihood is added to the rows of the
+		# sessions which share its stimulus and response, rather than expanded into a (sessions, paramComboCount) array.
+		groups = stimIndices*2 + responses
+		order = numpy.argsort(groups, kind='stable')
+		groupKeys, groupStarts = numpy.unique(groups[order], return_index=True)
+
+		p = None
+		pStimulusIndex = None
+		for key, sessions in zip(groupKeys, numpy.split(order, groupStarts[1:])):
+			stimulusIndex, outcome = divmod(key, 2)
+			if stimulusIndex != pStimulusIndex:
+				# Both outcomes of a stimulus are adjacent
+				contrastIndex, frequencyIndex = self.inflateStimulusIndex(stimulusIndex)[0]
+				p = QuickCSF.psychometric(self.csfTable[:, frequencyIndex], self.stimulusSpace[0][contrastIndex], self.d, self.sig)
+				pStimulusIndex = stimulusIndex
+
+			self.logPosterior[sessions] += numpy.log(p) if outcome else numpy.log1p(-p)
+
+	def _marginals(self):
+		'''All 4 marginal distributions of every session, each a (sessionCount, range) array'''
+
+		# The first parameter varies fastest in flattened indices, so it is the last axis
+		tensor = self.probabilities().reshape(self.sessionCount, *self.parameterRanges[::-1])
+		lowerPair = tensor.sum(axis=(1,2))
+		upperPair = tensor.sum(axis=(3,4))
+
+		return [lowerPair.sum(axis=1), lowerPair.sum(axis=2), upperPair.sum(axis=1), upperPair.sum(axis=2)]
+
+	def summarize(self):
+		'''Summarize the posterior distribution of each parameter in every session
+
+			All values are in (unmapped) parameter units, which can be converted with `QuickCSF.mapCSFParams()`
+
+			Returns:
+				dict keyed by parameter name, each a dict of:
+					mean, sd: moments of the marginals, with one value per session
+		'''
+
+		summary = {}
+		for name, values, marginal in zip(QuickCSF.PARAMETER_NAMES, self.parameterSpace, self._marginals()):
+			mean = numpy.dot(marginal, values)
+			variance = numpy.dot(marginal, numpy.square(values)) - numpy.square(mean)
+
+			summary[name] = {
+				'mean': mean,
+				'sd': numpy.sqrt(numpy.maximum(0, variance)),
+			}
+
+		return summary
+
+	def getResults(self, leaveAsIndices=False):
+		'''Calculate an estimate of all 4 parameters in every session based on their probabilities
+
+			Args:
+				leaveAsIndicies: if False, will output real-world, linear-scale values
+					if True, will output indices, which can be converted with `QuickCSF.mapCSFParams()`
+
+			Returns:
+				dict of arrays with one value per session
+		'''
+
+		summary = self.summarize()
+		results = numpy.stack([summary[name]['mean'] for name in QuickCSF.PARAMETER_NAMES], axis=1)
+
+		if not leaveAsIndices:
+			results = QuickCSF.mapCSFParams(results, True).T
+
+		return {
+			'peakSensitivity': results[:,0],
+			'peakFrequency': results[:,1],
+			'bandwidth': results[:,2],
+			'delta': results[:,3],
+			'aulcsf': numpy.array([QuickCSF.aulcsf(*sessionResults) for sessionResults in results])
+		}
@@ -7,6 +7,8 @@ import time, math
 
 from qtpy import QtWidgets, QtCore
 
+from . import timing
+
 logger = logging.getLogger(__name__)
 
 class State:
@@ -41,34 +43,127 @@ class InputState(State):
 class TimedState(State):
 	'''States that automatically finish after a fixed duration'''
 
-	def __init__(self, duration, nextStateName=None, name=None):
+	def __init__(self, duration, nextStateName=None, name=None, absorbsLateness=False):
+		'''
+			Args:
+				absorbsLateness: if True, when following another timed state, this state starts at the previous
+					state's deadline, so it is shortened by however late that state ended; otherwise it always
+					lasts its full duration
+		'''
 		super().__init__(nextStateName, name)
 		self.startTime = None
+		self.deadline = None
 		self.duration = duration
+		self.absorbsLateness = absorbsLateness
 
-	def start(self):
+	def start(self, startTime=None):
+		'''
+			Args:
+				startTime: `time.perf_counter()` time the state is considered to have started, defaults to now
+		'''
 		super().start()
-		self.startTime = time.time()
+		self.startTime = time.perf_counter() if startTime is None else startTime
+		self.deadline = self.startTime + self.duration
+
+	def remaining(self):
+		'''Seconds left until the deadline'''
+		return self.deadline - time.perf_counter()
 
 	def update(self):
 		if not self.finished:
-			self.finished = (time.time() - self.startTime) > self.duration
+			self.finished = self.remaining() <= 0
 
 class Trial_2AFC():
 	'''Represents a single trial'''
 
 	def __init__(self, stimulusOnFirst):
 		self.stimulusOnFirst = stimulusOnFirst
-		self.stimulus = {}
+		self.stimulus = None
 		self.correct = None
 		self.id = ''
 
+		# Seconds the trial was held back waiting for its stimulus to be generated
+		self.stimulusWait = 0
+
+		# Presentation and processing times, see the `timing` module
+		self.timing = {'states': [], 'displayUpdates': [], 'next': None, 'markResponse': None}
+
 	def __str__(self):
 		return self.__repr__()
 
 	def __repr__(self):
 		return f'{self.__class__.__name__}(' + str(vars(self)) + ')'
 
+class StimulusWorker(QtCore.QObject):
+	'''Runs the stimulus generator (estimator updates and stimulus rendering) outside of the GUI thread
+
+		Once moved to its own thread, the generator must only be used through this worker's slots
+	'''
+
+	# Each with the seconds spent doing the work, including any done ahead of time by speculation
+	stimulusReady = QtCore.Signal(object, float)
+	responseMarked = QtCore.Signal(object, float)
+
+	def __init__(self, stimulusGenerator, parent=None):
+		super().__init__(parent)
+
+		self.stimulusGenerator = stimulusGenerator
+		self.speculating = False
+
+		# Cleared by the controller (from its own thread) to stop pre-rendering between steps
+		self.prerendering = False
+
+	def _workDuration(self, name, duration):
+		'''The seconds of work behind a generator call which took `duration`
+
+			If the generator adopted work prepared by `speculate()`, that work's duration is used instead
+		'''
+
+		speculatedDurations = getattr(self.stimulusGenerator, 'speculatedDurations', {})
+		if speculatedDurations.get(name) is None:
+			return duration
+		else:
+			return speculatedDurations[name]
+
+	@QtCore.Slot()
+	def prepareStimulus(self):
+		startTime = time.perf_counter()
+		stimulus = self.stimulusGenerator.next()
+		self.stimulusReady.emit(stimulus, self._workDuration('next', time.perf_counter() - startTime))
+
+	@QtCore.Slot(bool)
+	def markResponse(self, correct):
+		'''Record a response, then emit an independent snapshot of the updated generator (e.g. for plotting)'''
+
+		self.speculating = False
+
+		startTime = time.perf_counter()
+		self.stimulusGenerator.markResponse(correct)
+		duration = self._workDuration('markResponse', time.perf_counter() - startTime)
+
+		self.responseMarked.emit(self.stimulusGenerator.fork(), duration)
+
+	@QtCore.Slot()
+	def speculate(self):
+		if hasattr(self.stimulusGenerator, 'speculate'):
+			self.speculating = True
+			self._speculateStep()
+
+	@QtCore.Slot()
+	def prerender(self):
+		if hasattr(self.stimulusGenerator, 'prerender'):
+			self.prerendering = True
+			self._prerenderStep()
+
+	def _prerenderStep(self):
+		if self.prerendering and self.stimulusGenerator.prerender():
+			QtCore.QTimer.singleShot(0, self._prerenderStep)
+
+	def _speculateStep(self):
+		# Return to this thread's event loop between steps, so a response is handled as soon as it arrives
+		if self.speculating and self.stimulusGenerator.speculate():
+			QtCore.QTimer.singleShot(0, self._speculateStep)
+
 class Controller_2AFC(QtCore.QObject):
 	'''A 2AFC experiment controller
 
@@ -85,6 +180,15 @@ class Controller_2AFC(QtCore.QObject):
 
 	stateTransition = QtCore.Signal(object, object)
 
+	# Emitted once a response has been recorded, with the trial and a snapshot of the stimulus generator
+	responseMarked = QtCore.Signal(object, object)
+
+	# Requests to the stimulus worker
+	_requestStimulus = QtCore.Signal()
+	_requestResponse = QtCore.Signal(bool)
+	_requestSpeculation = QtCore.Signal()
+	_requestPrerender = QtCore.Signal()
+
 	def __init__(self,
 		stimulusGenerator,
 		trialsPerBlock=2,
@@ -105,9 +209,34 @@ class Controller_2AFC(QtCore.QObject):
 			trialsPerBlock,
 			blockCount
 		)
+		self.trials = [trial for block in self.blocks for trial in block]
+		self.timingSummary = None
 		self.stateSpace = self._buildStateSpace(fixationDuration, stimulusDuration, maskDuration, interStimulusInterval, feedbackDuration, waitForReady)
 		self.state = self.stateSpace['INSTRUCTIONS']
 
+		# Estimator and rendering work happens in a worker thread, so it never stalls presentation
+		self.workerThread = QtCore.QThread(self)
+		self.worker = StimulusWorker(stimulusGenerator)
+		self.worker.moveToThread(self.workerThread)
+
+		self._requestStimulus.connect(self.worker.prepareStimulus)
+		self._requestResponse.connect(self.worker.markResponse)
+		self._requestSpeculation.connect(self.worker.speculate)
+		self._requestPrerender.connect(self.worker.prerender)
+		self.worker.stimulusReady.connect(self._onStimulusReady)
+		self.worker.responseMarked.connect(self._onResponseMarked)
+
+		# The snapshot of the stimulus generator delivered with the last recorded response
+		self._generatorSnapshot = None
+
+		# Trials awaiting a stimulus from the worker, in request order
+		self._stimulusRequests = []
+		self._pendingResponses = []
+		self._waitStart = None
+
+		# The trial and time the current state was entered
+		self._stateEntry = (None, None)
+
 	def _buildTrialBlocks(self, trialsPerBlock, blockCount):
 		'''Build blocks of trials
 
@@ -159,14 +288,15 @@ class Controller_2AFC(QtCore.QObject):
 		states['BREAKING'] = InputState(preTrialState.name)
 		states[preTrialState.name] = preTrialState
 
+		# Stimuli and masks always last their full duration; blanks absorb any lateness so it doesn't accumulate
 		states['FIXATION_CROSS'] = TimedState(fixationDuration, 'INTERSTIMULUS_BLANK_0')
-		states['INTERSTIMULUS_BLANK_0'] = TimedState(interStimulusInterval, 'SHOW_STIMULUS_1')
+		states['INTERSTIMULUS_BLANK_0'] = TimedState(interStimulusInterval, 'SHOW_STIMULUS_1', absorbsLateness=True)
 		states['SHOW_STIMULUS_1'] = TimedState(stimulusDuration, 'SHOW_MASK_1')
 		states['SHOW_MASK_1'] = TimedState(maskDuration, 'INTERSTIMULUS_BLANK_1')
-		states['INTERSTIMULUS_BLANK_1'] = TimedState(interStimulusInterval, 'SHOW_STIMULUS_2')
+		states['INTERSTIMULUS_BLANK_1'] = TimedState(interStimulusInterval, 'SHOW_STIMULUS_2', absorbsLateness=True)
 		states['SHOW_STIMULUS_2'] = TimedState(stimulusDuration, 'SHOW_MASK_2')
 		states['SHOW_MASK_2'] = TimedState(maskDuration, 'INTERSTIMULUS_BLANK_2')
-		states['INTERSTIMULUS_BLANK_2'] = TimedState(interStimulusInterval, 'WAIT_FOR_RESPONSE')
+		states['INTERSTIMULUS_BLANK_2'] = TimedState(interStimulusInterval, 'WAIT_FOR_RESPONSE', absorbsLateness=True)
 		states['WAIT_FOR_RESPONSE'] = InputState('FEEDBACK')
 		states['FEEDBACK'] = TimedState(feedbackDuration)
 
@@ -192,10 +322,81 @@ class Controller_2AFC(QtCore.QObject):
 	def start(self):
 		'''Insert `update` function call into the Qt event loop and initiate the starting state'''
 
+		self.workerThread.start()
+		QtWidgets.QApplication.instance().aboutToQuit.connect(self._stopWorker)
+
+		# Prepare the first stimulus, then others which are likely to be needed, while instructions are displayed
+		self._requestStimulusFor(self.getCurrentTrial())
+		self._requestPrerender.emit()
+
+		# Rather than polling, wake only for timed state deadlines, input and worker results
 		self.tick = QtCore.QTimer(self)
+		self.tick.setSingleShot(True)
+		self.tick.setTimerType(QtCore.Qt.PreciseTimer)
 		self.tick.timeout.connect(self._update)
-		self.tick.start()
+
+		self.state.start()
+		self._enterState()
 		self.stateTransition.emit(self.state.name, self.getCurrentTrial())
+		self._schedule()
+
+	def _wake(self):
+		'''Update as soon as control returns to the event loop'''
+		self.tick.start(0)
+
+	def _schedule(self):
+		'''Arm the timer for the current state's deadline, if it has one'''
+
+		if isinstance(self.state, TimedState):
+			# Timers have millisecond resolution, so wake no later than the deadline and re-arm if it's early
+			self.tick.start(max(0, int(self.state.remaining() * 1000)))
+		else:
+			self.tick.stop()
+
+	def _stopWorker(self):
+		self.workerThread.quit()
+		self.workerThread.wait()
+
+	def _requestStimulusFor(self, trial):
+		if trial is not None:
+			self._stimulusRequests.append(trial)
+			self._requestStimulus.emit()
+
+	def _onStimulusReady(self, stimulus, duration):
+		trial = self._stimulusRequests.pop(0)
+		trial.stimulus = stimulus
+		trial.timing['next'] = duration
+
+		if self._waitStart is not None:
+			self._wake()
+
+	def _onResponseMarked(self, stimulusGenerator, duration):
+		trial = self._pendingResponses.pop(0)
+		trial.timing['markResponse'] = duration
+		self._generatorSnapshot = stimulusGenerator
+		self.responseMarked.emit(trial, stimulusGenerator)
+
+		if self._waitStart is not None:
+			self._wake()
+
+	def onDisplayUpdated(self, stateName, timestamp):
+		'''Record when the display was changed for a state (a `time.perf_counter()` time)'''
+
+		trial = self.getCurrentTrial()
+		if trial is not None:
+			trial.timing['displayUpdates'].append((stateName, timestamp))
+
+	def _enterState(self):
+		self._stateEntry = (self.getCurrentTrial(), time.perf_counter())
+
+	def _exitState(self):
+		trial, enteredAt = self._stateEntry
+		if trial is not None:
+			trial.timing['states'].append((self.state.name, enteredAt, time.perf_counter()))
+
+	def getExpectedDurations(self):
+		'''The intended duration (seconds) of each timed state, keyed by state name'''
+		return {name: state.duration for name, state in self.stateSpace.items() if isinstance(state, TimedState)}
 
 	def getCurrentTrial(self):
 		if len(self.blocks) > 0 and len(self.blocks[0]) > 0:
@@ -203,6 +404,17 @@ class Controller_2AFC(QtCore.QObject):
 		else:
 			return None
 
+	def getFollowingTrial(self):
+		'''The trial after the current one, which may be in the next block'''
+
+		for block in self.blocks:
+			if len(block) > 0 and block[0] is not self.getCurrentTrial():
+				return block[0]
+			elif len(block) > 1:
+				return block[1]
+
+		return None
+
 	def checkState(self, okStates):
 		if not type(okStates) is list:
 			okStates = [okStates]
@@ -215,39 +427,75 @@ class Controller_2AFC(QtCore.QObject):
 	def onParticipantReady(self):
 		if self.checkState(['INSTRUCTIONS', 'WAIT_FOR_READY', 'BREAKING', 'FINISHED']):
 			self.state.finished = True
+			self._wake()
 
 	def onParticipantResponse(self, selectedFirstOption):
 		if self.checkState('WAIT_FOR_RESPONSE'):
 			trial = self.getCurrentTrial()
 			trial.correct = (selectedFirstOption == trial.stimulusOnFirst)
-			self.stimulusGenerator.markResponse(trial.correct)
 			self.state.finished = True
 
+			self._pendingResponses.append(trial)
+			self._requestResponse.emit(trial.correct)
+			self._requestStimulusFor(self.getFollowingTrial())
+			self._wake()
+
+	def _isWaitingForWorker(self):
+		'''Whether leaving the current (finished) state must wait for the stimulus worker
+
+			Trials don't start until their stimulus is ready, and results aren't reported until every response has been recorded
+		'''
+
+		trial = self.getCurrentTrial()
+		if self.state.getNextStateName() == 'FIXATION_CROSS':
+			ready = trial is None or trial.stimulus is not None
+		elif self.checkState('FEEDBACK') and self.getFollowingTrial() is None:
+			ready = len(self._pendingResponses) == 0
+		else:
+			return False
+
+		if not ready:
+			if self._waitStart is None:
+				self._waitStart = time.perf_counter()
+				logger.debug(f'Waiting for stimulus worker to finish {self.state.name}')
+			return True
+
+		if self._waitStart is not None:
+			waitDuration = time.perf_counter() - self._waitStart
+			self._waitStart = None
+			logger.debug(f'Waited {waitDuration:.4f}s for stimulus worker to finish {self.state.name}')
+
+			if self.state.getNextStateName() == 'FIXATION_CROSS':
+				trial.stimulusWait = waitDuration
+
+		return False
+
 	def _update(self):
 		'''Update the current state, transition to the next state if finished
 
 			Note:
-				This is called automatically by Qt's event loop after `start()` has been called
+				This is called by Qt's event loop, at each timed state's deadline and after input or worker results
 		'''
 
 		if self.state == None:
 			return
 
 		self.state.update()
-		if self.state.isFinished():
+		if not self.state.isFinished():
+			self._schedule()
+		else:
+			if self._isWaitingForWorker():
+				return
+
+			self._exitState()
+
 			if self.checkState(['INSTRUCTIONS', 'BREAKING']):
+				self.worker.prerendering = False
 				if len(self.blocks[0]) == 0:
 					self.blocks.pop(0)
 
-				trial = self.getCurrentTrial()
-				if trial is not None:
-					trial.stimulus = self.stimulusGenerator.next()
-
 			elif self.checkState('FEEDBACK'):
 				self.blocks[0].pop(0)
-				trial = self.getCurrentTrial()
-				if trial is not None:
-					trial.stimulus = self.stimulusGenerator.next()
 
 			nextStateName = self.state.getNextStateName()
 			if nextStateName is None:
@@ -255,10 +503,31 @@ class Controller_2AFC(QtCore.QObject):
 				self.tick.stop()
 				QtWidgets.QApplication.quit()
 			else:
+				previousState = self.state
 				self.state = self.stateSpace[nextStateName]
-				self.state.start()
+
+				chained = isinstance(previousState, TimedState) and isinstance(self.state, TimedState) and self.state.absorbsLateness
+				if chained and previousState.remaining() > -self.state.duration/2:
+					# Blanks start at the previous deadline so timer latency doesn't accumulate over a trial
+					self.state.start(previousState.deadline)
+				else:
+					self.state.start()
+
+				self._enterState()
 
 				if self.state.name == 'FINISHED':
-					self.stateTransition.emit(self.state.name, self.stimulusGenerator.getResults())
+					self.timingSummary = timing.summarize(self.trials, self.getExpectedDurations())
+					for name, summary in self.timingSummary.items():
+						logger.info(f'Timing error (ms) of {name}: ' + ', '.join(f'{key}={value:.3f}' for key, value in summary.items()))
+
+					# The generator belongs to the worker; every response has been recorded by now, so the last snapshot
+					# is up to date (without any trials, the worker never touched the generator)
+					snapshot = self._generatorSnapshot if self._generatorSnapshot is not None else self.stimulusGenerator
+					self.stateTransition.emit(self.state.name, snapshot.getResults())
 				else:
 					self.stateTransition.emit(self.state.name, self.getCurrentTrial())
+
+					if self.state.name == 'WAIT_FOR_RESPONSE':
+						self._requestSpeculation.emit()
+
+				self._schedule()
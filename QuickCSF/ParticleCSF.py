@@ -0,0 +1,297 @@
+# -*- coding: utf-8 -*
+'''A sequential Monte Carlo (particle filter) alternative to the grid-based qCSF estimator
+
+	The posterior is represented by weighted particles over continuous CSF parameters, so memory
+	and per-trial cost depend on the number of particles rather than the resolution of a grid.
+
+	Particles are stored in the same (index) units as QuickCSFEstimator's parameter grid, which
+	can be converted with `QuickCSF.mapCSFParams()`
+'''
+
+import logging
+import math
+
+import numpy
+
+from . import QuickCSF
+
+logger = logging.getLogger(__name__)
+
+class ParticleCSFEstimator(QuickCSF.ForkableEstimator):
+	# Log responses under this module rather than QuickCSF's
+	_logger = logger
+
+	def __init__(self, stimulusSpace=None, d=0.5, sig=0.25, particleCount=2000, bounds=QuickCSF.PARAMETER_BOUNDS,
+		resampleThreshold=.5, moveCount=3, moveScale=.5, randomSource=None
+	):
+		'''Create a new particle-filter estimator with the specified input space
+
+			Args:
+				stimulusSpace: 2,x numpy array of attributes to be used for stimulus generation
+					numpy.array([contrasts, frequencies])
+				d: lapse parameter of the psychometric function (1-d is the guess rate)
+				sig: slope parameter of the psychometric function
+				particleCount: number of particles representing the posterior
+				bounds: (lowest, highest) value of each parameter, in index units; the prior is uniform within them
+				resampleThreshold: particles are resampled when the effective sample size falls below this fraction of particleCount
+				moveCount: number of Metropolis-Hastings moves applied to the particles after each resampling
+				moveScale: size of the random-walk proposals, relative to the spread of the particles
+				randomSource: a numpy.random.Generator for reproducible results; defaults to the numpy.random module
+		'''
+		if stimulusSpace is None:
+			stimulusSpace = [
+				QuickCSF.makeContrastSpace(.0001, .05),
+				QuickCSF.makeFrequencySpace()
+			]
+
+		logger.info('Initializing ParticleCSFEstimator')
+		logger.debug(f'Initializing ParticleCSFEstimator particleCount={particleCount}, bounds={bounds}')
+
+		self.stimulusSpace = stimulusSpace
+
+		self.stimulusRanges = [len(sSpace) for sSpace in self.stimulusSpace]
+		self.stimComboCount = numpy.prod(self.stimulusRanges)
+
+		self.d = d
+		self.sig = sig
+
+		self.bounds = numpy.array(bounds, dtype=float)
+		self.resampleThreshold = resampleThreshold
+		self.moveCount = moveCount
+		self.moveScale = moveScale
+		self.random = numpy.random if randomSource is None else randomSource
+
+		# Draw the particles from the (uniform) prior
+		self.particles = self.random.uniform(self.bounds[:,0], self.bounds[:,1], (particleCount, len(self.bounds)))
+		self.logWeights = numpy.zeros(particleCount)
+
+		# Log-likelihood of every response so far for each particle, which is the target of the moves
+		self.logLikelihoods = numpy.zeros(particleCount)
+
+		# Number of incorrect and correct responses to each stimulus, so moves evaluate each tested stimulus once
+		self.responseCounts = numpy.zeros((self.stimComboCount, 2), dtype=numpy.int64)
+
+		self.filterReport = {'effectiveSampleSize': float(particleCount), 'resampleCount': 0, 'acceptanceRate': None}
+		self.stimulusIndexHistory = []
+
+		self.currentStimulusIndex = None
+		self.currentStimParamIndices = None
+		self.responseHistory = []
+
+	def _forkState(self, branch):
+		branch.particles = self.particles.copy()
+		branch.logWeights = self.logWeights.copy()
+		branch.logLikelihoods = self.logLikelihoods.copy()
+		branch.responseCounts = self.responseCounts.copy()
+		branch.filterReport = dict(self.filterReport)
+		branch.responseHistory = list(self.responseHistory)
+		branch.stimulusIndexHistory = list(self.stimulusIndexHistory)
+
+	@property
+	def weights(self):
+		'''Normalized weight of each particle'''
+
+		weights = numpy.exp(self.logWeights - self.logWeights.max())
+		return weights / weights.sum()
+
+	def next(self):
+		'''Determine the next stimulus to be tested'''
+
+		gain = self.selectionGain()
+
+		self.currentStimulusIndex = numpy.array([[QuickCSF.selectFromGain(gain, self.random)]])
+		self.currentStimParamIndices = self.inflateStimulusIndex(self.currentStimulusIndex)
+
+		return QuickCSF.Stimulus(
+			self.stimulusSpace[0][self.currentStimParamIndices[0][0]],
+			self.stimulusSpace[1][self.currentStimParamIndices[0][1]]
+		)
+
+	def selectionGain(self):
+		'''The information gain of every stimulus, used to select the next one'''
+		return self.informationGain()
+
+	def informationGain(self):
+		'''Calculates the expected information gain of every stimulus, weighting every particle'''
+
+		# Every frequency once, then every contrast against each (contrast varies fastest in stimulus indices)
+		logSensitivity = QuickCSF.csf_unmapped(self.particles, self.stimulusSpace[1].reshape(1,-1))
+		p = QuickCSF.psychometric(logSensitivity[:,:,numpy.newaxis], self.stimulusSpace[0], self.d, self.sig)
+		p = p.reshape(len(self.particles), -1)
+
+		weights = self.weights
+		pbar = numpy.dot(weights, p)
+		hbar = numpy.dot(weights, QuickCSF.entropy(p))
+
+		return QuickCSF.entropy(pbar)-hbar
+
+	def inflateStimulusIndex(self, stimulusIndex):
+		'''Converts a flattened stimulus index into its 2 constituent indices'''
+		return numpy.stack(numpy.unravel_index(stimulusIndex[:,0], self.stimulusRanges, order='F'), axis=1)
+
+	def _pmeas(self, particles, stimulusIndex=None):
+		'''Probability of a correct response for each particle (rows) to each stimulus (columns)'''
+
+		if stimulusIndex is None:
+			stimulusIndex = self.currentStimulusIndex
+
+		stimulusIndices = self.inflateStimulusIndex(stimulusIndex)
+
+		frequencies = self.stimulusSpace[1][stimulusIndices[:,1]].reshape(1,-1)
+		contrast = self.stimulusSpace[0][stimulusIndices[:,0]]
+
+		p = QuickCSF.csf_unmapped(particles, frequencies)
+		return QuickCSF.psychometric(p, contrast, self.d, self.sig, out=p)
+
+	def _historyLogLikelihoods(self, particles):
+		'''Log-likelihood of every recorded response for each of the specified particles
+
+			Each distinct stimulus is evaluated once and weighted by how often each response was given to it,
+			so the cost is bounded by the size of the stimulus space rather than growing with every trial
+		'''
+
+		tested = numpy.flatnonzero(self.responseCounts.any(axis=1))
+		counts = self.responseCounts[tested]
+		contrastIndices, frequencyIndices = self.inflateStimulusIndex(tested.reshape(-1,1)).T
+
+		# The CSF only needs evaluating once per tested frequency
+		frequencyIndices, frequencyColumns = numpy.unique(frequencyIndices, return_inverse=True)
+		logSensitivity = QuickCSF.csf_unmapped(particles, self.stimulusSpace[1][frequencyIndices].reshape(1,-1))
+		p = QuickCSF.psychometric(logSensitivity[:,frequencyColumns], self.stimulusSpace[0][contrastIndices], self.d, self.sig)
+
+		incorrect = counts[:,0] > 0
+		correct = counts[:,1] > 0
+		return numpy.dot(numpy.log1p(-p[:,incorrect]), counts[incorrect,0]) + numpy.dot(numpy.log(p[:,correct]), counts[correct,1])
+
+	def markResponse(self, response, stimIndex=None):
+		'''Record an observer's response and update particle weights
+
+			Args:
+				stimIndex: if not specified, will use the last stimulus generated by next()
+		'''
+
+		if type(response) == numpy.ndarray:
+			response = response.item(0)
+
+		if stimIndex is None:
+			stimIndex = self.currentStimulusIndex
+		stimIndices = self.inflateStimulusIndex(numpy.reshape(stimIndex, (-1,1)))
+
+		contrast = self.stimulusSpace[0][stimIndices[:,0]][0]
+		frequency = self.stimulusSpace[1][stimIndices[:,1]][0]
+
+		self._log(f'Marking response {stimIndex}[c={contrast},f={frequency}] = {response}')
+
+		self.responseHistory.append([
+			[contrast, frequency],
+			response
+		])
+
+		self.stimulusIndexHistory.append((numpy.reshape(stimIndex, -1).item(0), bool(response)))
+		self.responseCounts[self.stimulusIndexHistory[-1][0], int(bool(response))] += 1
+
+		p = self._pmeas(self.particles, numpy.reshape(stimIndex, (-1,1)))[:,0]
+		logLikelihood = numpy.log(p) if response else numpy.log1p(-p)
+		self.logWeights += logLikelihood
+		self.logLikelihoods += logLikelihood
+
+		weights = self.weights
+		self.filterReport['effectiveSampleSize'] = 1 / numpy.sum(numpy.square(weights))
+
+		if self.filterReport['effectiveSampleSize'] < self.resampleThreshold * len(self.particles):
+			self._resample(weights)
+			self._move()
+
+	def _resample(self, weights):
+		'''Systematic resampling: duplicate heavy particles and drop light ones, leaving equal weights'''
+
+		positions = (self.random.random() + numpy.arange(len(weights))) / len(weights)
+		cumulative = numpy.cumsum(weights)
+		cumulative[-1] = 1
+		indices = cumulative.searchsorted(positions, side='right')
+
+		self.particles = self.particles[indices]
+		self.logLikelihoods = self.logLikelihoods[indices]
+		self.logWeights = numpy.zeros(len(weights))
+
+		self.filterReport['resampleCount'] += 1
+
+	def _move(self):
+		'''Rejuvenate duplicated particles with random-walk Metropolis-Hastings moves
+
+			Each move targets the exact posterior (uniform prior within bounds times the likelihood of
+			every recorded response), so it restores diversity without biasing the estimate
+		'''
+
+		accepted = 0
+		for i in range(self.moveCount):
+			scale = self.moveScale * self.particles.std(axis=0)
+			proposals = self.particles + self.random.standard_normal(self.particles.shape) * scale
+
+			inBounds = numpy.all((proposals >= self.bounds[:,0]) & (proposals <= self.bounds[:,1]), axis=1)
+			proposalLogLikelihoods = numpy.full(len(proposals), -numpy.inf)
+			proposalLogLikelihoods[inBounds] = self._historyLogLikelihoods(proposals[inBounds])
+
+			accept = numpy.log(self.random.random(len(proposals))) < proposalLogLikelihoods - self.logLikelihoods
+			self.particles[accept] = proposals[accept]
+			self.logLikelihoods[accept] = proposalLogLikelihoods[accept]
+			accepted += numpy.count_nonzero(accept)
+
+		self.filterReport['acceptanceRate'] = accepted / (self.moveCount * len(self.particles))
+		logger.debug(f'Resampled particles: {self.filterReport}')
+
+	def summarize(self, credibleMass=.95):
+		'''Summarize the posterior distribution of each parameter, like `QuickCSFEstimator.summarize()`
+
+			All values are in (unmapped) parameter units, which can be converted with `mapCSFParams()`
+
+			Args:
+				credibleMass: probability mass contained within the central credible intervals
+
+			Returns:
+				dict keyed by parameter name, each a dict of:
+					mean, sd: weighted moments of the particles
+					credibleInterval: (lower, upper) weighted quantiles bounding the central `credibleMass`
+		'''
+
+		tail = (1 - credibleMass) / 2
+		weights = self.weights
+		summary = {}
+		for i, name in enumerate(QuickCSF.PARAMETER_NAMES):
+			values = self.particles[:,i]
+			mean = numpy.dot(weights, values)
+
+			order = numpy.argsort(values)
+			cumulative = numpy.cumsum(weights[order])
+			lower, upper = numpy.searchsorted(cumulative, [tail, 1-tail]).clip(0, len(values)-1)
+
+			summary[name] = {
+				'mean': mean,
+				'sd': math.sqrt(max(0, numpy.dot(weights, numpy.square(values - mean)))),
+				'credibleInterval': (values[order[lower]], values[order[upper]]),
+			}
+
+		return summary
+
+	def getResults(self, leaveAsIndices=False):
+		'''Calculate an estimate of all 4 parameters from the weighted mean of the particles
+
+			Args:
+				leaveAsIndicies: if False, will output real-world, linear-scale values
+					if True, will output indices, which can be converted with `mapCSFParams()`
+		'''
+
+		results = numpy.dot(self.weights, self.particles).reshape(1, -1)
+
+		if not leaveAsIndices:
+			results = QuickCSF.mapCSFParams(results, True).T
+
+		results = results.reshape(4).tolist()
+
+		return {
+			'peakSensitivity': results[0],
+			'peakFrequency': results[1],
+			'bandwidth': results[2],
+			'delta': results[3],
+			'aulcsf': QuickCSF.aulcsf(*results)
+		}
@@ -14,6 +14,11 @@ import logging
 
 import time
 import math
+import copy
+import os
+import pathlib
+import hashlib
+import concurrent.futures
 try:
 	from collections.abc import Iterable
 except ImportError:
@@ -28,6 +33,15 @@ class Stimulus:
 		self.contrast = contrast
 		self.frequency = frequency
 
+CSF_CHUNK_SIZE = 16384
+
+# Number of (parameter combinations, stimuli) float64 arrays alive at once while computing information gain
+GAIN_TEMPORARY_COUNT = 6
+
+# Pruning only starts once it would leave at most this fraction of parameter combinations active;
+# above it, gathering and scattering the active combinations costs more than updating all of them
+PRUNE_ACTIVE_FRACTION = .25
+
 def makeContrastSpace(min=.01, max=1, count=24):
 	'''Creates contrast values at log-linear equal1ly spaced intervals'''
 
@@ -62,7 +76,7 @@ def makeFrequencySpace(min=.2, max=36, count=20):
 
 	return frequencySpace
 
-def csf_unmapped(parameters, frequency):
+def csf_unmapped(parameters, frequency, out=None, chunkSize=CSF_CHUNK_SIZE):
 	'''The truncated log-parabola model for human contrast sensitivity
 
 		Expects UNMAPPED parameters
@@ -71,43 +85,92 @@ def csf_unmapped(parameters, frequency):
 	# Get everything into log-units
 	[peakSensitivity, peakFrequency, logBandwidth, delta] = mapCSFParams(parameters)
 
-	return csf(peakSensitivity, peakFrequency, logBandwidth, delta, frequency)
+	return csf(peakSensitivity, peakFrequency, logBandwidth, delta, frequency, out, chunkSize)
 
-def csf(peakSensitivity, peakFrequency, logBandwidth, delta, frequency):
-	frequency = numpy.log10(frequency)
+def csf(peakSensitivity, peakFrequency, logBandwidth, delta, frequency, out=None, chunkSize=CSF_CHUNK_SIZE):
+	'''Evaluates the truncated log-parabola for every combination of parameter rows and frequencies
+
+		Array parameters are expected in log units (as output by `mapCSFParams`) and are broadcast
+		against `frequency` as columns, so n parameter rows with a (1,m) frequency row give an (n,m)
+		result. Scalar parameters are linear-scale values (see `aulcsf`) and give a (1,1) result.
 
+		Args:
+			out (optional): array to receive the log sensitivities
+			chunkSize: number of parameter rows to evaluate at once, bounding the size of temporaries
+	'''
 	if not isinstance(peakSensitivity, Iterable):
-		delta = numpy.log10(peakSensitivity) - numpy.log10(peakSensitivity-delta)
-		delta = numpy.array([delta])
+		return numpy.array([[_csfScalar(peakSensitivity, peakFrequency, logBandwidth, delta, frequency)]])
+
+	frequency = numpy.log10(frequency)
 
-		peakSensitivity = numpy.array([numpy.log10(peakSensitivity)])
-		peakFrequency = numpy.array([numpy.log10(peakFrequency)])
-		logBandwidth = numpy.array([numpy.log10(logBandwidth)])
+	peakSensitivity = numpy.asarray(peakSensitivity)[:,numpy.newaxis]
+	peakFrequency = numpy.asarray(peakFrequency)[:,numpy.newaxis]
+	divisor = (numpy.log10(2)+numpy.asarray(logBandwidth))[:,numpy.newaxis]
+	cutoff = peakSensitivity - numpy.asarray(delta)[:,numpy.newaxis]
 
-		frequency = numpy.array([[frequency]])
+	shape = numpy.broadcast(peakFrequency, frequency).shape
+	if out is None:
+		out = numpy.empty(shape)
 
 	n = len(peakSensitivity)
-	m = len(frequency[0])
+	if n == 1 or chunkSize is None or n <= chunkSize:
+		_csfInto(peakSensitivity, peakFrequency, divisor, cutoff, frequency, out)
+	else:
+		# Frequencies may be a single row shared by every parameter row, or one row each
+		frequencyPerRow = numpy.ndim(frequency) == 2 and frequency.shape[0] > 1
+
+		# Reuse a single mask buffer for every chunk
+		below = numpy.empty((chunkSize,) + shape[1:], dtype=bool)
+		for start in range(0, n, chunkSize):
+			rows = slice(start, min(start+chunkSize, n))
+			_csfInto(
+				peakSensitivity[rows], peakFrequency[rows], divisor[rows], cutoff[rows],
+				frequency[rows] if frequencyPerRow else frequency, out[rows], below[:rows.stop-rows.start]
+			)
+
+	return out
 
-	frequency = frequency.repeat(n, 0)
+def _csfInto(peakSensitivity, peakFrequency, divisor, cutoff, frequency, out, below=None):
+	'''Evaluates the log-parabola into `out` without any full-size temporaries other than the `below` mask'''
 
-	peakFrequency = peakFrequency[:,numpy.newaxis].repeat(m,1)
-	peakSensitivity = peakSensitivity[:,numpy.newaxis].repeat(m,1)
-	delta = delta[:,numpy.newaxis].repeat(m,1)
+	numpy.subtract(frequency, peakFrequency, out=out)
+	below = numpy.less(out, 0, out=below)
 
-	divisor = numpy.log10(2)+logBandwidth
-	divisor = divisor[:,numpy.newaxis].repeat(m,1)
-	truncation = (4 * numpy.log10(2) * numpy.power(numpy.divide(frequency-peakFrequency, divisor), 2))
+	# truncation = 4*log10(2) * ((frequency-peakFrequency)/divisor)^2
+	numpy.divide(out, divisor, out=out)
+	numpy.power(out, 2, out=out)
+	numpy.multiply(4 * numpy.log10(2), out, out=out)
 
+	numpy.subtract(peakSensitivity, out, out=out)
+	numpy.maximum(0, out, out=out)
+
+	# Truncate at low frequencies
+	numpy.maximum(out, cutoff, out=out, where=below)
+
+def _csfScalar(peakSensitivity, peakFrequency, logBandwidth, delta, frequency):
+	'''Evaluates the log-parabola for a single set of linear-scale parameters and a single frequency
+
+		Uses numpy's scalar math (rather than `math`) so results match the array path bit-for-bit
+	'''
+
+	log10 = numpy.log10
+	frequency = log10(frequency)
+
+	delta = log10(peakSensitivity) - log10(peakSensitivity-delta)
+	peakSensitivity = log10(peakSensitivity)
+	peakFrequency = log10(peakFrequency)
+	divisor = log10(2) + log10(logBandwidth)
+
+	truncation = 4 * log10(2) * numpy.power((frequency-peakFrequency) / divisor, 2)
 	logSensitivity = numpy.maximum(0, peakSensitivity - truncation)
-	Scutoff = numpy.maximum(logSensitivity, peakSensitivity-delta)
-	logSensitivity[frequency<peakFrequency] = Scutoff[frequency<peakFrequency]
+	if frequency < peakFrequency:
+		logSensitivity = numpy.maximum(logSensitivity, peakSensitivity-delta)
 
 	return logSensitivity
 
 def aulcsf(peakSensitivity, peakFrequency, logBandwidth, delta, bucketWidth=.1):
 	def myCSF(frequency):
-		return csf(peakSensitivity, peakFrequency, logBandwidth, delta, frequency)[0][0]
+		return _csfScalar(peakSensitivity, peakFrequency, logBandwidth, delta, frequency)
 
 	gonePositive = False
 	done = False
@@ -130,6 +193,9 @@ def mapCSFParams(params, exponify=False):
 	'''
 		Maps parameter indices to log values
 
+		Indices are in units of the default grid's steps (0.1, 0.1, 0.05 and 0.1 log units), so
+		the fractional indices of refined grids map the same way
+
 		Exponify will de-log them, leaving the following units:
 			Peak Sensitivity: 1/contrast
 			Peak Frequency: cycles per degree
@@ -152,16 +218,496 @@ def mapCSFParams(params, exponify=False):
 
 	return numpy.stack((peakSensitivity, peakFrequency, bandwidth, delta))
 
+PARAMETER_NAMES = ['peakSensitivity', 'peakFrequency', 'bandwidth', 'delta']
+
+# Lowest and highest index of each parameter on the default grid
+PARAMETER_BOUNDS = [(0, 27), (0, 20), (0, 20), (0, 20)]
+
+def makeParameterSpace(counts=(28, 21, 21, 21), bounds=PARAMETER_BOUNDS):
+	'''Creates evenly spaced values of each parameter (in index units) between the specified bounds
+
+		Args:
+			counts: number of values of each parameter
+			bounds: (lowest, highest) index of each parameter
+	'''
+	return [numpy.linspace(lower, upper, count) for count, (lower, upper) in zip(counts, bounds)]
+
 def entropy(p):
 	return numpy.multiply(-p, numpy.log(p)) - numpy.multiply(1-p, numpy.log(1-p))
 
-class QuickCSFEstimator():
-	def __init__(self, stimulusSpace=None):
+def psychometric(logSensitivity, contrast, d, sig, out=None):
+	'''Probability of a correct response to stimuli of the specified contrasts
+
+		Computes 1 - d/(1+exp((csf-sensitivity)/sig)), in place if `out` is specified
+
+		Args:
+			logSensitivity: log10 CSF values, broadcastable against `contrast`
+			contrast: contrast of each stimulus
+			d: lapse parameter (1-d is the guess rate)
+			sig: slope parameter
+	'''
+
+	sensitivity = numpy.log10(numpy.divide(1, contrast))
+
+	out = numpy.subtract(logSensitivity, sensitivity, out=out)
+	numpy.divide(out, sig, out=out)
+	numpy.exp(out, out=out)
+	numpy.add(1, out, out=out)
+	numpy.divide(d, out, out=out)
+	numpy.subtract(1, out, out=out)
+
+	return out
+
+def selectFromGain(gain, randomSource=numpy.random):
+	'''Select a random stimulus index from the highest 10% info givers
+
+		Args:
+			randomSource: the numpy.random module or a numpy.random.Generator
+	'''
+
+	# Stimuli which were not evaluated have a gain of -inf
+	topCount = max(1, min(math.ceil(len(gain)/10), numpy.isfinite(gain).sum()))
+	topIndices = numpy.argpartition(-gain, topCount-1)[:topCount]
+
+	return topIndices[int(randomSource.random()*topCount)]
+
+LIKELIHOOD_TABLE_VERSION = 1
+
+def likelihoodTableKey(stimulusSpace, parameterSpace, d, sig):
+	'''Creates a content hash of everything a likelihood table depends on'''
+
+	digest = hashlib.sha1(f'qcsf-likelihood-v{LIKELIHOOD_TABLE_VERSION}'.encode())
+	for space in list(stimulusSpace) + list(parameterSpace):
+		space = numpy.ascontiguousarray(space, dtype=numpy.float64)
+		digest.update(str(space.shape).encode())
+		digest.update(space.tobytes())
+
+	digest.update(numpy.array([d, sig], dtype=numpy.float64).tobytes())
+
+	return digest.hexdigest()
+
+def loadLikelihoodTable(estimator, cachePath, chunkSize=16, kind='likelihood'):
+	'''Loads (building it first if necessary) the likelihood table for an estimator as a read-only memory map
+
+		The table is stored stimulus-major (stimComboCount x paramComboCount, float32) so that the
+		likelihoods for a single stimulus are one contiguous read. It holds the probability of an
+		INCORRECT response, which keeps full float32 relative precision for both p and 1-p.
+
+		Args:
+			estimator: a QuickCSFEstimator whose spaces, d and sig define the table
+			cachePath: directory in which tables are stored, named by their content hash
+			chunkSize: number of stimuli computed at once while building
+			kind: 'likelihood', or 'entropy' for the (same-shaped) table of response entropies
+	'''
+
+	cachePath = pathlib.Path(cachePath)
+	cachePath.mkdir(parents=True, exist_ok=True)
+
+	key = likelihoodTableKey(estimator.stimulusSpace, estimator.parameterSpace, estimator.d, estimator.sig)
+	path = cachePath / f'{kind}-{key}.npy'
+	shape = (int(estimator.stimComboCount), int(estimator.paramComboCount))
+
+	if path.exists():
+		try:
+			table = numpy.load(path, mmap_mode='r')
+			if table.shape == shape and table.dtype == numpy.float32:
+				logger.debug(f'Using {kind} table {path}')
+				return table
+		except ValueError:
+			pass
+
+		logger.warning(f'Discarding malformed {kind} table {path}')
+
+	logger.info(f'Building {kind} table {path}')
+
+	# Build into a private file, then atomically move it into place so concurrent processes never see a partial table
+	tempPath = path.with_name(f'{path.name}.{os.getpid()}.tmp')
+	table = numpy.lib.format.open_memmap(tempPath, mode='w+', dtype=numpy.float32, shape=shape)
+
+	parameterIndex = numpy.arange(estimator.paramComboCount)[:,numpy.newaxis]
+	for start in range(0, shape[0], chunkSize):
+		stimulusIndex = numpy.arange(start, min(start+chunkSize, shape[0])).reshape(-1, 1)
+		p = estimator._pmeas(parameterIndex, stimulusIndex)
+		table[stimulusIndex[:,0]] = (entropy(p) if kind == 'entropy' else 1 - p).T
+
+	table.flush()
+	del table
+	os.replace(tempPath, path)
+
+	return numpy.load(path, mmap_mode='r')
+
+class LogPosterior():
+	'''A posterior distribution stored as unnormalized log-probabilities
+
+		Likelihoods are accumulated in place, so no per-update arrays are allocated, and
+		normalization is deferred (via a cached logsumexp) until probabilities are requested
+
+		Optionally, updates can be restricted to a subset of "active" parameter combinations;
+		all others are frozen and treated as having zero probability until they are readmitted
+	'''
+
+	def __init__(self, count, dtype=numpy.float64):
+		'''Create a uniform posterior
+
+			Args:
+				count: number of parameter combinations
+				dtype: storage type of the log-probabilities (numpy.float32 halves the memory)
+		'''
+		self.logProbabilities = numpy.zeros(count, dtype=dtype)
+		self._buffer = numpy.empty(count, dtype=dtype)
+		self._probabilities = numpy.empty((count, 1))
+		self._logNormalizer = None
+		self._normalized = False
+
+		# Total amount subtracted from the stored values by re-centering
+		self.logOffset = 0.
+
+		# Sorted indices of the combinations being updated (None means all of them); the others are frozen
+		self.activeIndices = None
+
+		# Incremented on every change, so derived quantities can be cached
+		self.version = 0
+
+	def copy(self):
+		'''Creates an independent copy of this posterior'''
+
+		posterior = copy.copy(self)
+		posterior.logProbabilities = self.logProbabilities.copy()
+		posterior._buffer = numpy.empty_like(self._buffer)
+		posterior._probabilities = self._probabilities.copy()
+
+		return posterior
+
+	def _changed(self):
+		self._logNormalizer = None
+		self._normalized = False
+		self.version += 1
+
+	def update(self, probability, outcome=True):
+		'''Multiply the posterior by `probability` (or `1-probability` if `outcome` is False)
+
+			If some combinations are inactive, `probability` only covers the active ones
+		'''
+
+		buffer = self._buffer[:len(probability)]
+		if outcome:
+			numpy.log(probability, out=buffer)
+		else:
+			numpy.negative(probability, out=buffer)
+			numpy.log1p(buffer, out=buffer)
+
+		if self.activeIndices is None:
+			self.logProbabilities += buffer
+		else:
+			self.logProbabilities[self.activeIndices] += buffer
+
+		self._changed()
+
+	def addLogLikelihoods(self, logLikelihoods):
+		'''Multiply the posterior by likelihoods given in the log domain
+
+			If some combinations are inactive, `logLikelihoods` only covers the active ones
+		'''
+
+		if self.activeIndices is None:
+			self.logProbabilities += logLikelihoods
+		else:
+			self.logProbabilities[self.activeIndices] += logLikelihoods
+
+		self._changed()
+
+	def setProbabilities(self, probabilities):
+		with numpy.errstate(divide='ignore'):
+			numpy.log(numpy.reshape(probabilities, -1), out=self.logProbabilities)
+
+		self.logOffset = 0.
+		self.activeIndices = None
+		self._changed()
+
+	def restrict(self, activeIndices, droppedIndices):
+		'''Freeze currently active combinations, treating them as impossible until they are readmitted
+
+			Frozen combinations keep their (absolute, i.e. not re-centered) log-probability
+
+			Args:
+				activeIndices: the (sorted) combinations which remain active
+				droppedIndices: the currently active combinations not in `activeIndices`
+		'''
+
+		self.logProbabilities[droppedIndices] += self.logOffset
+		self._probabilities[droppedIndices, 0] = 0
+		self.activeIndices = activeIndices
+		self._changed()
+
+	def readmit(self, indices, logLikelihoods):
+		'''Make frozen combinations active again
+
+			Args:
+				indices: the combinations to readmit
+				logLikelihoods: their total log-likelihood for all updates made while they were frozen
+		'''
+
+		self.logProbabilities[indices] += logLikelihoods - self.logOffset
+
+		# A mask keeps the indices sorted without sorting them
+		active = numpy.zeros(len(self.logProbabilities), dtype=bool)
+		active[self.activeIndices] = True
+		active[indices] = True
+		self.activeIndices = numpy.flatnonzero(active)
+		if len(self.activeIndices) == len(self.logProbabilities):
+			self.activeIndices = None
+
+		self._changed()
+
+	def logNormalizer(self):
+		'''The log of the sum of all (unnormalized) probabilities'''
+
+		if self._logNormalizer is None:
+			self._normalize()
+
+		return self._logNormalizer
+
+	def _normalize(self):
+		# Exponentiate in float64 regardless of storage type, then normalize in place
+		if self.activeIndices is None:
+			# Re-center on the peak so the stored values stay bounded over long sessions
+			peak = self.logProbabilities.max()
+			self.logProbabilities -= peak
+
+			output = self._probabilities[:,0]
+			numpy.exp(self.logProbabilities, out=output, dtype=numpy.float64)
+			total = numpy.sum(output)
+			output /= total
+		else:
+			# Inactive combinations are already zero in the output, so only touch active ones
+			values = self.logProbabilities[self.activeIndices]
+			peak = values.max()
+			values -= peak
+			self.logProbabilities[self.activeIndices] = values
+
+			output = numpy.exp(values.astype(numpy.float64))
+			total = numpy.sum(output)
+			self._probabilities[self.activeIndices, 0] = output / total
+
+		self.logOffset += peak
+		self._logNormalizer = math.log(total)
+		self._normalized = True
+
+	def probabilities(self):
+		'''Normalized probabilities as a read-only (count, 1) float64 array
+
+			Note:
+				The array is reused; it is only valid until the next update
+		'''
+
+		if not self._normalized:
+			self._normalize()
+
+		view = self._probabilities.view()
+		view.flags.writeable = False
+		return view
+
+class SelectionStrategy():
+	'''Base class for ways of estimating the information gain of every stimulus
+
+		Subclasses implement `informationGain`; `report` describes the most recent estimate
+	'''
+
+	def __init__(self):
+		self.report = {}
+
+	def informationGain(self, estimator):
+		raise NotImplementedError()
+
+class SampledSelection(SelectionStrategy):
+	'''Average the gain over random parameter samples drawn from the posterior'''
+
+	def __init__(self, sampleCount=100):
+		super().__init__()
+		self.sampleCount = sampleCount
+
+	def informationGain(self, estimator):
+		startTime = time.perf_counter()
+		gain = estimator._sampledInformationGain(self.sampleCount)
+		self.report = {'elapsed_ms': 1000*(time.perf_counter()-startTime), 'sampleCount': self.sampleCount}
+
+		return gain
+
+class ExactSelection(SelectionStrategy):
+	'''Weight every parameter combination by its posterior probability'''
+
+	def informationGain(self, estimator):
+		startTime = time.perf_counter()
+		gain = estimator.informationGain()
+		self.report = {'elapsed_ms': 1000*(time.perf_counter()-startTime), 'sampleCount': estimator.paramComboCount}
+
+		return gain
+
+class AnytimeSelection(SelectionStrategy):
+	'''Refine a sampled gain estimate until a time budget is spent
+
+		Parameter samples are drawn in doubling batches; a batch is only started if, at the measured
+		cost per sample, it is expected to finish before the deadline. If even the first batch cannot
+		cover every stimulus in time, stimuli are evaluated piece by piece in random order and only
+		those reached before the deadline are candidates.
+
+		All of the estimator's lookup tables are built before the first trial, so the budget only
+		has to cover the gain estimate itself.
+	'''
+
+	def __init__(self, budget_ms=50, initialSampleCount=25, maxSampleCount=3200, stimulusChunkCount=8):
+		'''
+			Args:
+				budget_ms: time allowed for each estimate, in milliseconds
+				initialSampleCount: number of parameter samples in the first batch
+				maxSampleCount: stop refining once this many samples have been evaluated
+				stimulusChunkCount: number of pieces the stimulus space is split into for the first batch
+		'''
+		super().__init__()
+		self.budget_ms = budget_ms
+		self.initialSampleCount = initialSampleCount
+		self.maxSampleCount = maxSampleCount
+		self.stimulusChunkCount = stimulusChunkCount
+
+	def informationGain(self, estimator):
+		startTime = time.perf_counter()
+		deadline = startTime + self.budget_ms/1000
+
+		stimCount = estimator.stimComboCount
+		pSum = numpy.zeros(stimCount)
+		hSum = numpy.zeros(stimCount)
+		evaluated = numpy.zeros(stimCount, dtype=bool)
+
+		# First batch: cover the stimuli piece by piece so there is always something to choose from
+		batchSize = self.initialSampleCount
+		paramIndicies = estimator._sampleParameters(batchSize)
+		for stimIndicies in numpy.array_split(estimator.random.permutation(stimCount), self.stimulusChunkCount):
+			chunkStart = time.perf_counter()
+			p = estimator._likelihoods(paramIndicies, stimIndicies)
+			pSum[stimIndicies] = p.sum(axis=0)
+			hSum[stimIndicies] = entropy(p).sum(axis=0)
+			evaluated[stimIndicies] = True
+
+			# Only start another piece if it is expected to finish in time
+			now = time.perf_counter()
+			if now + (now-chunkStart) > deadline:
+				break
+
+		sampleCount = batchSize
+		rounds = 1
+		if evaluated.all():
+			allStimuli = numpy.arange(stimCount)
+			while sampleCount < self.maxSampleCount:
+				batchSize = min(2*batchSize, self.maxSampleCount-sampleCount)
+				costPerSample = (time.perf_counter()-startTime) / sampleCount
+				if time.perf_counter() + costPerSample*batchSize > deadline:
+					break
+
+				p = estimator._likelihoods(estimator._sampleParameters(batchSize), allStimuli)
+				pSum += p.sum(axis=0)
+				hSum += entropy(p).sum(axis=0)
+				sampleCount += batchSize
+				rounds += 1
+
+		gain = numpy.full(stimCount, -numpy.inf)
+		pbar = pSum[evaluated]/sampleCount
+		gain[evaluated] = entropy(pbar) - hSum[evaluated]/sampleCount
+
+		elapsed = 1000*(time.perf_counter()-startTime)
+		self.report = {
+			'elapsed_ms': elapsed,
+			'budget_ms': self.budget_ms,
+			'budgetUsed': elapsed / self.budget_ms,
+			'sampleCount': sampleCount,
+			'rounds': rounds,
+			'stimuliEvaluated': int(evaluated.sum()),
+		}
+
+		return gain
+
+class ForkableEstimator():
+	'''Lets an estimator explore hypothetical responses on independent copies of itself
+
+		Messages passed to `_log()` on a copy are held back until the copy is passed to `adopt()`,
+		so logs only record what happened on the branch that was kept. Subclasses copy any state
+		they modify in place in `_forkState()`.
+	'''
+
+	# The logger `_log()` writes to
+	_logger = logger
+
+	# If a list, messages are collected here instead of being logged (see `fork()`)
+	deferredLog = None
+
+	def fork(self):
+		'''Creates an independent copy of this estimator, e.g. to explore a hypothetical response
+
+			Messages logged by the copy are not logged until it is passed to `adopt()`
+		'''
+
+		branch = copy.copy(self)
+		self._forkState(branch)
+		branch.deferredLog = []
+
+		return branch
+
+	def _forkState(self, branch):
+		'''Gives a copy created by `fork()` its own copies of any state modified in place'''
+		pass
+
+	def adopt(self, branch):
+		'''Takes on the state of a copy created by `fork()`, logging the messages that were deferred on it'''
+
+		messages = branch.deferredLog
+		deferredLog = self.deferredLog
+		self.__dict__.update(branch.__dict__)
+
+		# If this is itself a copy, the messages stay deferred until it is adopted in turn
+		self.deferredLog = deferredLog
+		for message in messages:
+			self._log(message)
+
+	def _log(self, message):
+		'''Logs an info message, or defers it if this is a copy created by `fork()`'''
+
+		if self.deferredLog is None:
+			self._logger.info(message)
+		else:
+			self.deferredLog.append(message)
+
+class QuickCSFEstimator(ForkableEstimator):
+	def __init__(self, stimulusSpace=None, d=0.5, sig=0.25, likelihoodCachePath=None, posteriorDtype=numpy.float64, trackMarginals=False, selectionMode='sampled',
+		pruneThreshold=None, pruneMass=None, readmitInterval=10, parameterSpace=None, refineInterval=None, refineMass=.999,
+		randomSource=None
+	):
 		'''Create a new QuickCSF estimator with the specified input/output spaces
 
 			Args:
 				stimulusSpace: 2,x numpy array of attributes to be used for stimulus generation
 					numpy.array([contrasts, frequencies])
+				d: lapse parameter of the psychometric function (1-d is the guess rate)
+				sig: slope parameter of the psychometric function
+				likelihoodCachePath: if specified, a directory in which to store/reuse a precomputed likelihood table
+				posteriorDtype: storage type of the log-posterior (numpy.float32 halves its memory)
+				trackMarginals: if True, `runningSummary` is refreshed after every response
+				selectionMode: how the information gain of each stimulus is estimated
+					'sampled': average over 100 random parameter samples drawn from the posterior
+					'exact': weight every parameter combination by its posterior probability
+						(best combined with `likelihoodCachePath`, which also caches an entropy table)
+					or any SelectionStrategy instance, e.g. AnytimeSelection(budget_ms=30)
+				pruneThreshold: if specified, parameter combinations whose probability falls below this are pruned
+				pruneMass: if specified, the least probable parameter combinations that together hold at most
+					this much probability are pruned
+				readmitInterval: with pruning, how many trials pass between pruning steps; each step first brings the
+					pruned combinations bordering the active ones up to date with the responses they missed and readmits them.
+					Nothing is pruned until at most `PRUNE_ACTIVE_FRACTION` of the combinations would remain active.
+				parameterSpace: values of each parameter to be estimated, in (possibly fractional) index units,
+					see `makeParameterSpace()`; defaults to the full-resolution grid, or a half-resolution grid
+					if `refineInterval` is specified
+				refineInterval: if specified, every this many trials the grid is fitted to the region holding
+					`refineMass` of each marginal, keeping the same number of values per parameter (see `refine()`)
+				refineMass: probability mass of each marginal kept within a refined grid
+				randomSource: a numpy.random.Generator for reproducible stimulus selection; defaults to the numpy.random module
 		'''
 		if stimulusSpace is None:
 			stimulusSpace = [
@@ -169,71 +715,260 @@ class QuickCSFEstimator():
 				makeFrequencySpace()
 			]
 
-		parameterSpace = [
-			numpy.arange(0, 28),	# Peak sensitivity
-			numpy.arange(0, 21),	# Peak frequency
-			numpy.arange(0, 21),	# Log bandwidth
-			numpy.arange(0, 21)		# Low frequency truncation (log delta)
-		]
+		if parameterSpace is None:
+			if refineInterval is None:
+				parameterSpace = [
+					numpy.arange(0, 28),	# Peak sensitivity
+					numpy.arange(0, 21),	# Peak frequency
+					numpy.arange(0, 21),	# Log bandwidth
+					numpy.arange(0, 21)		# Low frequency truncation (log delta)
+				]
+			else:
+				# Start coarse; refinement adds precision where it's needed
+				parameterSpace = makeParameterSpace((14, 11, 11, 11))
 
 		logger.info('Initializing QuickCSFEStimator')
 		logger.debug('Initializing QuickCSFEstimator stimSpace='+str(stimulusSpace).replace('\n','')+', paramSpace='+str(parameterSpace).replace('\n',''))
 
 		self.stimulusSpace = stimulusSpace
-		self.parameterSpace = parameterSpace
 
 		self.stimulusRanges = [len(sSpace) for sSpace in self.stimulusSpace]
 		self.stimComboCount = numpy.prod(self.stimulusRanges)
 
+		self.d = d
+		self.sig = sig
+		self.posteriorDtype = posteriorDtype
+		self.random = numpy.random if randomSource is None else randomSource
+
+		self.trackMarginals = trackMarginals
+		self.runningSummary = None
+
+		self.pruneThreshold = pruneThreshold
+		self.pruneMass = pruneMass
+		self.readmitInterval = readmitInterval
+		# prunedMass is the total probability the currently frozen combinations had when they were pruned;
+		# maxError is the largest prunedMass (or mass found when readmitting) so far
+		self.pruningReport = {'activeCount': 0, 'prunedMass': 0., 'readmittedMass': 0., 'maxError': 0.}
+		self.stimulusIndexHistory = []
+
+		self.refineInterval = refineInterval
+		self.refineMass = refineMass
+
+		self._setParameterSpace(parameterSpace)
+
+		if selectionMode == 'sampled':
+			self.selectionStrategy = SampledSelection()
+		elif selectionMode == 'exact':
+			self.selectionStrategy = ExactSelection()
+		elif isinstance(selectionMode, SelectionStrategy):
+			self.selectionStrategy = selectionMode
+		else:
+			raise ValueError(f'Unknown selection mode: {selectionMode}')
+		self.lastSelectionReport = {}
+
+		if likelihoodCachePath is not None:
+			self.likelihoodTable = loadLikelihoodTable(self, likelihoodCachePath)
+			if isinstance(self.selectionStrategy, ExactSelection):
+				self.entropyTable = loadLikelihoodTable(self, likelihoodCachePath, kind='entropy')
+
+		self.currentStimulusIndex = None
+		self.currentStimParamIndices = None
+		self.responseHistory = []
+
+	def _forkState(self, branch):
+		branch.posterior = self.posterior.copy()
+		branch.responseHistory = list(self.responseHistory)
+		branch.stimulusIndexHistory = list(self.stimulusIndexHistory)
+		branch.pruningReport = dict(self.pruningReport)
+		branch._prunedAt = self._prunedAt.copy()
+		branch._prunedMass = self._prunedMass.copy()
+
+	def _setParameterSpace(self, parameterSpace):
+		'''Replaces the parameter grid, rebuilding everything derived from it
+
+			The posterior is recomputed exactly from the responses recorded so far (starting from a uniform prior)
+		'''
+
+		self.parameterSpace = parameterSpace
+
 		self.parameterRanges = [len(pSpace) for pSpace in self.parameterSpace]
 		self.paramComboCount = numpy.prod(self.parameterRanges)
 
-		self.d = 0.5
-		self.sig = 0.25
+		# Grid coordinates of every parameter combination and their mapped (log-unit) values
+		self.parameterIndices = self._buildParameterIndices()
+		self.mappedParameters = mapCSFParams(numpy.stack(
+			[pSpace[self.parameterIndices[:,i]] for i,pSpace in enumerate(self.parameterSpace)],
+			axis=1
+		))
+		self.mappedParameters.flags.writeable = False
+
+		# Log sensitivity of every parameter combination at every frequency, computed up front so no trial pays for it
+		# Stored a frequency per column, so each trial's lookups are contiguous
+		self.csfTable = csf(
+			*self.mappedParameters, self.stimulusSpace[1].reshape(1,-1),
+			out=numpy.empty((self.paramComboCount, self.stimulusRanges[1]), order='F')
+		)
+		self.csfTable.flags.writeable = False
+
+		# Tables are only valid for the grid they were built for
+		self.likelihoodTable = None
+		self.entropyTable = None
 
 		# Probabilities (initialize all of them to equal values that sum to 1)
-		self.probabilities = numpy.ones((self.paramComboCount,1))/self.paramComboCount
+		self.posterior = LogPosterior(self.paramComboCount, self.posteriorDtype)
+		self._marginalCache = None
+		self._cdfCache = None
 
-		self.currentStimulusIndex = None
-		self.currentStimParamIndices = None
-		self.responseHistory = []
+		allIndices = numpy.arange(self.paramComboCount).reshape(-1, 1)
+		for stimIndex, response in self.stimulusIndexHistory:
+			self.posterior.update(self._pmeas(allIndices, numpy.array([[stimIndex]]))[:,0], response)
+
+		# Number of responses recorded when each parameter combination was last pruned, and its probability then
+		self._prunedAt = numpy.zeros(self.paramComboCount, dtype=numpy.int32)
+		self._prunedMass = numpy.zeros(self.paramComboCount)
+		self.pruningReport.update({'activeCount': self.paramComboCount, 'prunedMass': 0.})
 
 	def next(self):
 		'''Determine the next stimulus to be tested'''
 
+		gain = self.selectionGain()
+		self.currentStimulusIndex = numpy.array([[self._selectFromGain(gain)]])
+		self.currentStimParamIndices = self.inflateStimulusIndex(self.currentStimulusIndex)
+
+		return Stimulus(
+			self.stimulusSpace[0][self.currentStimParamIndices[0][0]],
+			self.stimulusSpace[1][self.currentStimParamIndices[0][1]]
+		)
+
+	def selectionGain(self):
+		'''The information gain of every stimulus, as estimated by the selection strategy'''
+
+		gain = self.selectionStrategy.informationGain(self)
+		self.lastSelectionReport = self.selectionStrategy.report
+		logger.debug(f'Stimulus selection: {self.lastSelectionReport}')
+
+		return gain
+
+	def _selectFromGain(self, gain):
+		'''Select a random stimulus index from the highest 10% info givers'''
+		return selectFromGain(gain, self.random)
+
+	def _sampleParameters(self, count):
+		'''Draws flattened parameter indices, weighted by their posterior probability
+
+			Equivalent to `numpy.random.choice(paramComboCount, count, p=probabilities)`, but the
+			cumulative distribution is only rebuilt when the posterior changes
+		'''
+
+		activeIndices = self.posterior.activeIndices
+
+		if self._cdfCache is None or self._cdfCache[0] != self.posterior.version:
+			if activeIndices is None:
+				cdf = numpy.cumsum(self.probabilities[:,0])
+			else:
+				cdf = numpy.cumsum(self.probabilities[activeIndices,0])
+			cdf /= cdf[-1]
+			self._cdfCache = (self.posterior.version, cdf)
+
+		uniformSamples = self.random.random(count)
+		paramIndicies = self._cdfCache[1].searchsorted(uniformSamples, side='right')
+		if activeIndices is not None:
+			paramIndicies = activeIndices[paramIndicies]
+
+		return paramIndicies.reshape(-1, 1)
+
+	def _likelihoods(self, paramIndicies, stimIndicies):
+		'''Probability of a correct response for each (parameter row, stimulus column)'''
+
+		if self.likelihoodTable is None:
+			return self._pmeas(paramIndicies, numpy.reshape(stimIndicies, (-1,1)))
+		else:
+			return 1 - self.likelihoodTable[numpy.ix_(numpy.reshape(stimIndicies, -1), paramIndicies[:,0])].T.astype(numpy.float64)
+
+	def _sampledInformationGain(self, randomSampleCount=100):
+		'''Estimates the information gain of every stimulus from random samples of the parameter space'''
+
 		# collect random samples from input space
 		# the randomness is weighted by the stim parameter probability
 		# more probable stim params have higher weight of being sampled
-		randomSampleCount = 100
-
-		paramIndicies = numpy.random.choice(
-			numpy.arange(self.paramComboCount),
-			randomSampleCount,
-			p=self.probabilities[:,0]
-		).reshape(-1, 1)
+		paramIndicies = self._sampleParameters(randomSampleCount)
 
 		# calculate probabilities for all stimuli with all samples of parameters
-		# @TODO: parallelize this
-		stimIndicies = numpy.arange(self.stimComboCount).reshape(-1,1)
-		p = self._pmeas(paramIndicies, stimIndicies)
+		p = self._likelihoods(paramIndicies, numpy.arange(self.stimComboCount))
 
 		# Determine amount of information to be gained
-		pbar = sum(p)/randomSampleCount
-		hbar = sum(entropy(p))/randomSampleCount
-		gain = entropy(pbar)-hbar
+		pbar = p.sum(axis=0)/randomSampleCount
+		hbar = entropy(p).sum(axis=0)/randomSampleCount
 
-		# Sort by gain descending (highest gain first)
-		sortMap = numpy.argsort(-gain)
+		return entropy(pbar)-hbar
 
-		# select a random one from the highest 10% info givers
-		randIndex = int(numpy.random.rand()*self.stimComboCount/10)
-		self.currentStimulusIndex = numpy.array([[sortMap[randIndex]]])
-		self.currentStimParamIndices = self.inflateStimulusIndex(self.currentStimulusIndex)
+	def informationGain(self, weights=None, chunkSize=4096, maxBytes=None, threads=None):
+		'''Calculates the exact expected information gain of every stimulus
 
-		return Stimulus(
-			self.stimulusSpace[0][self.currentStimParamIndices[0][0]],
-			self.stimulusSpace[1][self.currentStimParamIndices[0][1]]
-		)
+			pbar and hbar are posterior-weighted sums over every parameter combination, i.e.
+			matrix-vector products, which numpy hands to its (multithreaded) BLAS
+
+			Args:
+				weights: probability of each parameter combination (defaults to the posterior, restricted to active combinations)
+				chunkSize: number of parameter combinations evaluated at once when the likelihood tables can't be used directly
+				maxBytes: if specified, keeps the temporaries of all chunks being evaluated within this many bytes,
+					by shrinking `chunkSize` if a single chunk wouldn't fit and evaluating fewer chunks at once
+				threads: if specified, up to this many chunks are evaluated at once by separate threads (numpy releases the GIL)
+
+			Chunk boundaries only depend on `chunkSize` and `maxBytes`, so the result doesn't depend on `threads`
+		'''
+
+		activeIndices = None
+		if weights is None:
+			activeIndices = self.posterior.activeIndices
+			if activeIndices is None:
+				weights = self.probabilities[:,0]
+			else:
+				weights = self.probabilities[activeIndices,0]
+
+		if activeIndices is None and self.likelihoodTable is not None and self.entropyTable is not None:
+			# Keep the products in float32 so the memory-mapped tables are never copied
+			weights = weights.astype(numpy.float32)
+			pbar = 1 - numpy.dot(self.likelihoodTable, weights).astype(numpy.float64)
+			hbar = numpy.dot(self.entropyTable, weights).astype(numpy.float64)
+		else:
+			if activeIndices is None:
+				activeIndices = numpy.arange(self.paramComboCount)
+
+			concurrency = threads or 1
+			if maxBytes is not None:
+				# A chunk's likelihoods and the temporaries of their entropy are each a float64 per stimulus
+				combinationBytes = GAIN_TEMPORARY_COUNT * 8 * self.stimComboCount
+				chunkSize = max(1, min(chunkSize, maxBytes // combinationBytes))
+				concurrency = max(1, min(concurrency, maxBytes // (chunkSize * combinationBytes)))
+
+			stimIndicies = numpy.arange(self.stimComboCount)
+
+			def chunkSums(start):
+				paramIndicies = activeIndices[start:start+chunkSize].reshape(-1,1)
+				chunkWeights = weights[start:start+chunkSize]
+
+				p = self._likelihoods(paramIndicies, stimIndicies)
+				return numpy.dot(chunkWeights, p), numpy.dot(chunkWeights, entropy(p))
+
+			def accumulate(sums):
+				# Accumulate in chunk order, so the result doesn't depend on the number of threads
+				pbar = numpy.zeros(self.stimComboCount)
+				hbar = numpy.zeros(self.stimComboCount)
+				for chunkPbar, chunkHbar in sums:
+					pbar += chunkPbar
+					hbar += chunkHbar
+
+				return pbar, hbar
+
+			starts = range(0, len(activeIndices), chunkSize)
+			if concurrency == 1:
+				pbar, hbar = accumulate(map(chunkSums, starts))
+			else:
+				with concurrent.futures.ThreadPoolExecutor(concurrency) as executor:
+					pbar, hbar = accumulate(executor.map(chunkSums, starts))
+
+		return entropy(pbar)-hbar
 
 	def _inflate(self, index, ranges):
 		'''Inflates a flattened list of indexes into lists of lists of indexes'''
@@ -247,9 +982,23 @@ class QuickCSFEstimator():
 
 		return indices
 
+	def _buildParameterIndices(self):
+		'''Builds a compact, read-only table of the 4 grid coordinates of every flattened parameter index'''
+
+		dtype = numpy.int8 if max(self.parameterRanges) <= numpy.iinfo(numpy.int8).max else numpy.int16
+		indices = numpy.empty((self.paramComboCount, len(self.parameterRanges)), dtype=dtype)
+
+		# The first parameter varies fastest, matching `_inflate`
+		coordinates = numpy.unravel_index(numpy.arange(self.paramComboCount), self.parameterRanges, order='F')
+		for i, coordinate in enumerate(coordinates):
+			indices[:,i] = coordinate
+
+		indices.flags.writeable = False
+		return indices
+
 	def inflateParameterIndex(self, parameterIndex):
 		'''Converts a flattened parameter index into its 4 constituent indices'''
-		return self._inflate(parameterIndex, self.parameterRanges)
+		return self.parameterIndices[parameterIndex[:,0]].astype(parameterIndex.dtype)
 
 	def inflateStimulusIndex(self, stimulusIndex):
 		'''Converts a flattened stimulus index into its 2 constituent indices'''
@@ -258,30 +1007,22 @@ class QuickCSFEstimator():
 	def _pmeas(self, parameterIndex, stimulusIndex=None):
 		'''Calculates probability for a configuration of parameters'''
 
-		# Check if param list is a single-dimension
-		if parameterIndex.shape[1] == 1:
-			# If it's a single dimension, we need to unroll it into 4 separate ones
-			parameters = self.inflateParameterIndex(parameterIndex)
-		else:
-			parameters = parameterIndex
-
 		# Unroll into separate rows
 		if stimulusIndex is None:
 			stimulusIndex = self.currentStimulusIndex
 
 		stimulusIndices = self.inflateStimulusIndex(stimulusIndex)
 
-		frequencies = self.stimulusSpace[1][stimulusIndices[:,1]].reshape(1,-1)
-		csfValues = csf_unmapped(parameters, frequencies)
+		# Check if param list is a single-dimension
+		if parameterIndex.shape[1] == 1:
+			# Flattened indices into the parameter grid can be looked up in the CSF table
+			p = self.csfTable[numpy.ix_(parameterIndex[:,0], stimulusIndices[:,1])]
+		else:
+			frequencies = self.stimulusSpace[1][stimulusIndices[:,1]].reshape(1,-1)
+			p = csf_unmapped(parameterIndex, frequencies)
 
-		# Make vector of sensitivities
 		contrast = self.stimulusSpace[0][stimulusIndices[:,0]]
-
-		sensitivity = numpy.log10(
-			numpy.ones((parameters.shape[0], 1)) * numpy.divide(1, contrast)
-		)
-
-		return 1 - numpy.divide(self.d, 1+numpy.exp((csfValues-sensitivity) / self.sig))
+		return psychometric(p, contrast, self.d, self.sig, out=p)
 
 	def markResponse(self, response, stimIndex=None):
 		'''Record an observer's response and update parameter probabilities
@@ -295,43 +1036,336 @@ class QuickCSFEstimator():
 
 		if stimIndex is None:
 			stimIndex = self.currentStimulusIndex
-			stimIndices = self.inflateStimulusIndex(stimIndex)
+		stimIndex = numpy.reshape(stimIndex, (1,1))
+		stimIndices = self.inflateStimulusIndex(stimIndex)
 
 		contrast = self.stimulusSpace[0][stimIndices[:,0]][0]
 		frequency = self.stimulusSpace[1][stimIndices[:,1]][0]
 
-		logger.info(f'Marking response {stimIndex}[c={contrast},f={frequency}] = {response}')
+		self._log(f'Marking response {stimIndex}[c={contrast},f={frequency}] = {response}')
 
 		self.responseHistory.append([
 			[contrast, frequency],
 			response
 		])
 
-		# get probability for this stimulus
-		pm = self._pmeas(
-			numpy.arange(self.paramComboCount)[:,numpy.newaxis],
-			stimIndex
-		)
+		self.stimulusIndexHistory.append((stimIndex.item(0), bool(response)))
+
+		# get probability for this stimulus and update the posterior in place
+		activeIndices = self.posterior.activeIndices
+		if self.likelihoodTable is None:
+			if activeIndices is None:
+				activeIndices = numpy.arange(self.paramComboCount)
+
+			pm = self._pmeas(activeIndices[:,numpy.newaxis], stimIndex)
+			self.posterior.update(pm[:,0], bool(response))
+		else:
+			# The table holds the probability of an incorrect response
+			pm = self.likelihoodTable[stimIndex.item(0)]
+			if activeIndices is not None:
+				pm = pm[activeIndices]
+
+			self.posterior.update(pm, not response)
+
+		if self.pruneThreshold is not None or self.pruneMass is not None:
+			if len(self.stimulusIndexHistory) % self.readmitInterval == 0:
+				self._readmit()
+				self._prune()
+
+		if self.refineInterval is not None and len(self.stimulusIndexHistory) % self.refineInterval == 0:
+			self.refine()
+
+		if self.trackMarginals:
+			self.runningSummary = self.summarize()
+
+	def markResponses(self, stimIndices, responses, chunkSize=4096):
+		'''Record many responses at once, e.g. to replay a stored session
+
+			The posterior is updated with one sum of log-likelihoods, counting the correct and incorrect
+			responses to each distinct stimulus. Unlike calling `markResponse()` for each response, the
+			responses are not logged individually and no pruning or refinement steps are run.
+
+			Args:
+				stimIndices: flattened index of the stimulus of each response
+				responses: whether each response was correct
+				chunkSize: number of parameter combinations evaluated at once
+		'''
+
+		stimIndices = numpy.reshape(stimIndices, -1).astype(numpy.int64)
+		responses = numpy.reshape(responses, -1).astype(bool)
+
+		logger.debug(f'Marking {len(responses)} responses')
+
+		stimParamIndices = self.inflateStimulusIndex(stimIndices.reshape(-1,1))
+		contrasts = self.stimulusSpace[0][stimParamIndices[:,0]]
+		frequencies = self.stimulusSpace[1][stimParamIndices[:,1]]
+
+		for stimIndex, contrast, frequency, response in zip(stimIndices.tolist(), contrasts, frequencies, responses.tolist()):
+			self.responseHistory.append([[contrast, frequency], response])
+			self.stimulusIndexHistory.append((stimIndex, response))
+
+		uniqueIndices, inverse = numpy.unique(stimIndices, return_inverse=True)
+		correctCounts = numpy.bincount(inverse, weights=responses, minlength=len(uniqueIndices))
+		incorrectCounts = numpy.bincount(inverse, minlength=len(uniqueIndices)) - correctCounts
+
+		# Only stimuli with responses of each kind contribute, which also avoids 0 * log(0)
+		correctStimuli = correctCounts > 0
+		incorrectStimuli = incorrectCounts > 0
+
+		activeIndices = self.posterior.activeIndices
+		if activeIndices is None:
+			activeIndices = numpy.arange(self.paramComboCount)
+
+		logLikelihoods = numpy.empty(len(activeIndices))
+		for start in range(0, len(activeIndices), chunkSize):
+			rows = slice(start, start+chunkSize)
+			p = self._likelihoods(activeIndices[rows].reshape(-1,1), uniqueIndices)
+
+			with numpy.errstate(divide='ignore'):
+				logLikelihoods[rows] = (
+					numpy.dot(numpy.log(p[:,correctStimuli]), correctCounts[correctStimuli])
+					+ numpy.dot(numpy.log1p(-p[:,incorrectStimuli]), incorrectCounts[incorrectStimuli])
+				)
+
+		self.posterior.addLogLikelihoods(logLikelihoods)
+
+		if self.trackMarginals:
+			self.runningSummary = self.summarize()
+
+	def _prune(self):
+		'''Remove negligible parameter combinations from further updates'''
+
+		activeIndices = self.posterior.activeIndices
+		if activeIndices is None:
+			p = self.probabilities[:,0]
+
+			# While every combination is active, pruning only pays off if it leaves few of them active
+			minDropCount = len(p) - int(PRUNE_ACTIVE_FRACTION * len(p))
+		else:
+			p = self.probabilities[activeIndices,0]
+			minDropCount = 0
+
+		if self.pruneMass is not None:
+			threshold = self._pruneMassThreshold(p, minDropCount)
+			if threshold is None:
+				return
+		else:
+			threshold = min(self.pruneThreshold, p.max())
+
+		dropped = p < threshold
+		dropCount = numpy.count_nonzero(dropped)
+		if dropCount == 0 or dropCount < minDropCount:
+			return
+
+		if activeIndices is None:
+			droppedIndices = numpy.flatnonzero(dropped)
+			keptIndices = numpy.flatnonzero(~dropped)
+		else:
+			droppedIndices = activeIndices[dropped]
+			keptIndices = activeIndices[~dropped]
 
-		if response:
-			self.probabilities = numpy.multiply(self.probabilities, pm)
+		self._prunedAt[droppedIndices] = len(self.stimulusIndexHistory)
+		self._prunedMass[droppedIndices] = p[dropped]
+
+		# The total probability of every frozen combination when it was pruned
+		self.pruningReport['prunedMass'] += numpy.sum(p[dropped])
+		self.pruningReport['maxError'] = max(self.pruningReport['maxError'], self.pruningReport['prunedMass'])
+
+		self.posterior.restrict(keptIndices, droppedIndices)
+		self.pruningReport['activeCount'] = len(keptIndices)
+
+		logger.debug(f'Pruned posterior: {self.pruningReport}')
+
+	def _pruneMassThreshold(self, p, minDropCount=0):
+		'''The smallest probability that must be kept so that the dropped total stays within pruneMass
+
+			Rather than sorting every probability, the `minDropCount` smallest are partitioned off and
+			only the remaining ones small enough to fit in the budget are sorted
+
+			Returns:
+				the threshold, or None if the `minDropCount` smallest probabilities don't fit in the budget
+		'''
+
+		budget = self.pruneMass
+		if minDropCount > 0:
+			if minDropCount >= len(p):
+				return None
+
+			p = numpy.partition(p, minDropCount)
+			lowerMass = p[:minDropCount].sum()
+			if lowerMass > budget:
+				return None
+
+			budget -= lowerMass
+			p = p[minDropCount:]
+
+		droppable = p <= budget
+		candidates = numpy.sort(p[droppable])
+		dropCount = numpy.searchsorted(numpy.cumsum(candidates), budget, side='right')
+
+		if dropCount < len(candidates):
+			return candidates[dropCount]
+		elif len(candidates) < len(p):
+			return p[~droppable].min()
 		else:
-			self.probabilities = numpy.multiply(self.probabilities, (1-pm))
+			return p.max()
+
+	def _readmit(self):
+		'''Readmit the pruned parameter combinations which neighbor active ones
+
+			Each is first brought up to date with the responses recorded since it was pruned, so the
+			readmitted probabilities are exact. Any that are still negligible are pruned again afterwards.
+		'''
+
+		activeIndices = self.posterior.activeIndices
+		if activeIndices is None:
+			return
+
+		# Grow the active region by one grid step along each parameter axis
+		# (the first parameter varies fastest, so in C order the axes are reversed, which doesn't matter here)
+		active = numpy.zeros(self.paramComboCount, dtype=bool)
+		active[activeIndices] = True
+		active = active.reshape(self.parameterRanges[::-1])
+
+		grown = active.copy()
+		for axis in range(active.ndim):
+			lower = [slice(None)] * active.ndim
+			upper = [slice(None)] * active.ndim
+			lower[axis] = slice(None, -1)
+			upper[axis] = slice(1, None)
+			grown[tuple(lower)] |= active[tuple(upper)]
+			grown[tuple(upper)] |= active[tuple(lower)]
+
+		candidates = numpy.flatnonzero((grown & ~active).reshape(-1))
+		if len(candidates) == 0:
+			return
+
+		stimIndicies = numpy.array([stimIndex for stimIndex, response in self.stimulusIndexHistory])
+		responses = numpy.array([response for stimIndex, response in self.stimulusIndexHistory])
+
+		# Catch up on missed responses, grouped by when each combination was pruned
+		logLikelihoods = numpy.empty(len(candidates))
+		prunedAt = self._prunedAt[candidates]
+		for trialIndex in numpy.unique(prunedAt):
+			group = numpy.flatnonzero(prunedAt == trialIndex)
+			p = self._likelihoods(candidates[group].reshape(-1,1), stimIndicies[trialIndex:])
+			logLikelihoods[group] = numpy.where(responses[trialIndex:], numpy.log(p), numpy.log1p(-p)).sum(axis=1)
+
+		self.posterior.readmit(candidates, logLikelihoods)
+
+		prunedMass = max(0., self.pruningReport['prunedMass'] - numpy.sum(self._prunedMass[candidates]))
+		self._prunedMass[candidates] = 0
+
+		# The mass found outside the previously active set is error that pruning actually introduced
+		readmittedMass = numpy.sum(self.probabilities[candidates,0])
+		self.pruningReport.update({
+			'activeCount': len(self.posterior.activeIndices) if self.posterior.activeIndices is not None else self.paramComboCount,
+			'prunedMass': prunedMass,
+			'readmittedMass': readmittedMass,
+			'maxError': max(self.pruningReport['maxError'], prunedMass, readmittedMass),
+		})
+
+	def refine(self):
+		'''Fits the parameter grid to the region holding most of the probability
+
+			Each parameter keeps the same number of values, spread evenly over its central `refineMass`
+			credible interval padded by one current grid step on each side. Where the interval reaches
+			an edge of the grid, the probability may really lie beyond it (e.g. if early responses were
+			misleading), so the grid is instead widened by its current span on that side. Grids never
+			extend past `PARAMETER_BOUNDS`, and parameters whose grid would not change are left alone.
+		'''
+
+		summary = self.summarize(self.refineMass)
+
+		parameterSpace = []
+		for name, values, (lowerBound, upperBound) in zip(PARAMETER_NAMES, self.parameterSpace, PARAMETER_BOUNDS):
+			span = values[-1] - values[0]
+			step = span / max(1, len(values)-1)
+			lower, upper = summary[name]['credibleInterval']
+			lower = max(lowerBound, values[0] - span if lower <= values[0] else lower - step)
+			upper = min(upperBound, values[-1] + span if upper >= values[-1] else upper + step)
 
-		# Normalize probabilities
-		self.probabilities = self.probabilities/numpy.sum(self.probabilities)
+			if lower < values[0] or upper > values[-1] or upper - lower < span:
+				parameterSpace.append(numpy.linspace(lower, upper, len(values)))
+			else:
+				parameterSpace.append(values)
+
+		if all(newValues is values for newValues, values in zip(parameterSpace, self.parameterSpace)):
+			return
+
+		self._log('Refining parameter grid paramSpace='+str(parameterSpace).replace('\n',''))
+		self._setParameterSpace(parameterSpace)
+
+	@property
+	def probabilities(self):
+		'''Normalized parameter probabilities as a (paramComboCount, 1) array'''
+		return self.posterior.probabilities()
+
+	@probabilities.setter
+	def probabilities(self, probabilities):
+		self.posterior.setProbabilities(probabilities)
 
 	def margin(self, parameterIndex):
-		params = numpy.arange(self.paramComboCount).reshape(-1,1)
-		params = self.inflateParameterIndex(params)
+		return self._marginals()[parameterIndex].reshape(-1, 1)
+
+	def _marginals(self):
+		'''Computes all 4 marginal distributions with two reductions over the 4-D posterior tensor'''
+
+		if self._marginalCache is not None and self._marginalCache[0] == self.posterior.version:
+			return self._marginalCache[1]
+
+		activeIndices = self.posterior.activeIndices
+		if activeIndices is None:
+			# The first parameter varies fastest in flattened indices
+			tensor = self.probabilities[:,0].reshape(self.parameterRanges, order='F')
+			lowerPair = tensor.sum(axis=(2,3))
+			upperPair = tensor.sum(axis=(0,1))
+
+			marginals = [lowerPair.sum(axis=1), lowerPair.sum(axis=0), upperPair.sum(axis=1), upperPair.sum(axis=0)]
+		else:
+			# Only active combinations can hold any probability
+			p = self.probabilities[activeIndices,0]
+			marginals = [
+				numpy.bincount(self.parameterIndices[activeIndices,i], weights=p, minlength=parameterRange)
+				for i, parameterRange in enumerate(self.parameterRanges)
+			]
+		self._marginalCache = (self.posterior.version, marginals)
+
+		return marginals
+
+	def summarize(self, credibleMass=.95):
+		'''Summarize the posterior distribution of each parameter
 
-		pMarg = numpy.zeros((self.parameterRanges[parameterIndex], 1))
-		for parameterCalcIndex in range(self.parameterRanges[parameterIndex]):
-			# Filter out all the other parameters' values
-			parameterFilterMask = (params[:, parameterIndex] == parameterCalcIndex).reshape(-1, 1)
-			pMarg[parameterCalcIndex] = numpy.sum(numpy.multiply(self.probabilities, parameterFilterMask))
+			All values are in (unmapped) parameter units, which can be converted with `mapCSFParams()`
 
-		return pMarg
+			Args:
+				credibleMass: probability mass contained within the central credible intervals
+
+			Returns:
+				dict keyed by parameter name, each a dict of:
+					values: the grid values of the parameter
+					marginal: the marginal probability of each grid value
+					mean, sd, mode: moments and most probable value of the marginal
+					credibleInterval: (lower, upper) grid values bounding the central `credibleMass`
+		'''
+
+		tail = (1 - credibleMass) / 2
+		summary = {}
+		for name, values, marginal in zip(PARAMETER_NAMES, self.parameterSpace, self._marginals()):
+			mean = numpy.dot(marginal, values)
+			cumulative = numpy.cumsum(marginal)
+			lower, upper = numpy.searchsorted(cumulative, [tail, 1-tail]).clip(0, len(values)-1)
+
+			summary[name] = {
+				'values': values,
+				'marginal': marginal,
+				'mean': mean,
+				'sd': math.sqrt(max(0, numpy.dot(marginal, numpy.square(values - mean)))),
+				'mode': values[numpy.argmax(marginal)],
+				'credibleInterval': (values[lower], values[upper]),
+			}
+
+		return summary
 
 	def getResults(self, leaveAsIndices=False):
 		'''Calculate an estimate of all 4 parameters based on their probabilities
@@ -341,14 +1375,9 @@ class QuickCSFEstimator():
 					if True, will output indices, which can be converted with `mapCSFParams()`
 		'''
 
-		params = numpy.arange(self.paramComboCount).reshape(-1,1)
-		params = self.inflateParameterIndex(params)
-
 		# Calculate a mean value for each of the estimated parameters
-		estimatedParamMeans = numpy.zeros(len(self.parameterRanges))
-		for n, parameterRange in enumerate(self.parameterRanges):
-			pMarg = self.margin(n)
-			estimatedParamMeans[n] = numpy.dot(pMarg.T, numpy.arange(parameterRange))
+		summary = self.summarize()
+		estimatedParamMeans = numpy.array([summary[name]['mean'] for name in PARAMETER_NAMES])
 
 		results = estimatedParamMeans.reshape(1,len(self.parameterRanges))
 
@@ -1,11 +1,17 @@
 '''Classes to generate stimuli for testing'''
 
+import logging
 import random
+import collections
+import time
 
 import numpy
 
 from . import QuickCSF
-from . import gaborPatch
+from . import ParticleCSF
+from . import gabor
+
+logger = logging.getLogger(__name__)
 
 class Stimulus:
 	def __init__(self, contrast, frequency, orientation, size):
@@ -20,44 +26,278 @@ class Stimulus:
 	def __repr__(self):
 		return f'c={self.contrast},f={self.frequency},o={self.orientation},s={self.size}'
 
-class QuickCSFGenerator(QuickCSF.QuickCSFEstimator):
-	''' Generate fixed-size stimuli with contrast/spatial frequency determined by QuickCSF
+def makeStimulusSpace(minContrast=.01, maxContrast=1.0, contrastResolution=24, minFrequency=0.2, maxFrequency=36.0, frequencyResolution=20):
+	return [
+		QuickCSF.makeContrastSpace(minContrast, maxContrast, contrastResolution),
+		QuickCSF.makeFrequencySpace(minFrequency, maxFrequency, frequencyResolution)
+	]
 
-		If orientation is None, random orientations will be generated
+class StimulusCache():
+	'''A least-recently-used cache of rendered stimuli, bounded by their total size in bytes'''
+
+	def __init__(self, maxBytes, byteCount):
+		'''
+			Args:
+				maxBytes: the most memory the cached stimuli may use
+				byteCount: function which returns the size in bytes of a stimulus
+		'''
+		self.maxBytes = maxBytes
+		self.byteCount = byteCount
+		self.bytes = 0
+		self.hits = 0
+		self.misses = 0
+		self._images = collections.OrderedDict()
+
+	def __contains__(self, key):
+		return key in self._images
+
+	def __len__(self):
+		return len(self._images)
+
+	def get(self, key):
+		image = self._images.get(key)
+		if image is None:
+			self.misses += 1
+		else:
+			self.hits += 1
+			self._images.move_to_end(key)
+
+		return image
+
+	def hasRoomFor(self, byteCount):
+		return self.bytes + byteCount <= self.maxBytes
+
+	def put(self, key, image):
+		if key in self._images:
+			return
+
+		byteCount = self.byteCount(image)
+		if byteCount > self.maxBytes:
+			return
+
+		self._images[key] = image
+		self.bytes += byteCount
+
+		while self.bytes > self.maxBytes:
+			evictedKey, evicted = self._images.popitem(last=False)
+			self.bytes -= self.byteCount(evicted)
+
+class GaborGenerator():
+	''' Mixin which presents an estimator's stimuli as fixed-size gabor patches
+
+		Combine with an estimator class (e.g. QuickCSF.QuickCSFEstimator), listing this first.
+		If orientation is None, random orientations will be generated, as multiples of orientationStep if it is specified
+
+		Stimuli are rendered by `renderer`: 'qimage' for QImages, 'array' for NumPy arrays (without needing Qt),
+		or any object with the methods of `gabor.ArrayRenderer`
+
+		Unless orientations are random and unquantized, rendered images are kept in an LRU cache of up to
+		cacheBytes (0 disables it), which `prerender()` can fill ahead of time. Images are shared between
+		trials, so they must not be modified.
+
+		While waiting for a response, `speculate()` can prepare the estimator update and the next
+		stimulus for each possible response, so that `markResponse()` and `next()` return immediately.
+		How long that work took is kept in `speculatedDurations`.
 	'''
 
-	def __init__(self,
-		size=100, orientation=None,
-		minContrast=.01, maxContrast=1.0, contrastResolution=24,
-		minFrequency=0.2, maxFrequency=36.0, frequencyResolution=20,
-		degreesToPixels=None
-	):
-		super().__init__(
-			stimulusSpace = [
-				QuickCSF.makeContrastSpace(minContrast, maxContrast, contrastResolution),
-				QuickCSF.makeFrequencySpace(minFrequency, maxFrequency, frequencyResolution)
-			]
-		)
+	def __init__(self, size=100, orientation=None, degreesToPixels=None, orientationStep=None, cacheBytes=64*2**20, renderer='qimage', **estimatorSettings):
+		super().__init__(**estimatorSettings)
 
 		self.size = size
 		self.orientation = orientation
+		self.orientationStep = orientationStep
+		self.renderer = gabor.makeRenderer(renderer)
+		self.stimulusCache = StimulusCache(cacheBytes, self.renderer.byteCount)
+		self._prerenderQueue = None
 
 		if degreesToPixels is None:
 			self.degreesToPixels = lambda x: x
 		else:
 			self.degreesToPixels = degreesToPixels
 
+		# Prepared (estimator, stimulus, durations) for each response to the current stimulus
+		self._speculation = {}
+		self._pendingStimulus = None
+
+		# Seconds spent by `speculate()` on the work behind the latest `markResponse()` and `next()`,
+		# or None where they did the work themselves
+		self.speculatedDurations = {'markResponse': None, 'next': None}
+
+	def _forkState(self, branch):
+		super()._forkState(branch)
+		branch._speculation = {}
+		branch._pendingStimulus = None
+		branch.speculatedDurations = {'markResponse': None, 'next': None}
+
+	def speculate(self):
+		'''Prepares the outcome of one more possible response to the current stimulus
+
+			Each call does the work of one `markResponse()` and `next()`, so callers can keep the
+			event loop responsive between calls
+
+			Returns:
+				True if there are more responses left to prepare
+		'''
+
+		for response in [True, False]:
+			if response not in self._speculation:
+				branch = self.fork()
+
+				startTime = time.perf_counter()
+				branch.markResponse(response)
+				markedTime = time.perf_counter()
+				stimulus = branch.next()
+				durations = {'markResponse': markedTime - startTime, 'next': time.perf_counter() - markedTime}
+
+				self._speculation[response] = (branch, stimulus, durations)
+
+				return len(self._speculation) < 2
+
+		return False
+
+	def markResponse(self, response, stimIndex=None):
+		if type(response) == numpy.ndarray:
+			response = response.item(0)
+
+		speculation = self._speculation.get(bool(response)) if stimIndex is None else None
+		self._speculation = {}
+
+		if speculation is None:
+			super().markResponse(response, stimIndex)
+			self.speculatedDurations = {'markResponse': None, 'next': None}
+		else:
+			branch, stimulus, durations = speculation
+			self.adopt(branch)
+			self._pendingStimulus = (stimulus, durations['next'])
+			self.speculatedDurations = {'markResponse': durations['markResponse'], 'next': None}
+
 	def next(self):
-		stimulus = super().next()
+		self._speculation = {}
+
+		if self._pendingStimulus is not None:
+			stimulus, self.speculatedDurations['next'] = self._pendingStimulus
+			self._pendingStimulus = None
+			return stimulus
+
+		self.speculatedDurations['next'] = None
+		super().next()
 
 		if self.orientation is None:
 			orientation = random.random() * 360
+			if self.orientationStep is not None:
+				orientation = (round(orientation / self.orientationStep) * self.orientationStep) % 360
 		else:
 			orientation = self.orientation
 
-		return gaborPatch.ContrastGaborPatchImage(
-			size=self.degreesToPixels(self.size),
-			contrast=stimulus.contrast,
-			frequency=1/self.degreesToPixels(1/stimulus.frequency),
-			orientation=orientation
+		return self._render(*self.currentStimParamIndices[0], orientation)
+
+	def _reusesOrientations(self):
+		'''Whether orientations repeat, so rendered stimuli can be reused'''
+		return self.orientation is not None or self.orientationStep is not None
+
+	def _render(self, contrastIndex, frequencyIndex, orientation):
+		'''Renders (or reuses) the image of a stimulus
+
+			The colors are determined by the contrast, so they need not be part of the cache key.
+			With random, unquantized orientations, images are never reused, so they aren't cached.
+		'''
+
+		size = self.degreesToPixels(self.size)
+		key = (int(contrastIndex), int(frequencyIndex), orientation, size)
+
+		reusable = self._reusesOrientations()
+		image = self.stimulusCache.get(key) if reusable else None
+		if image is None:
+			frequency = self.stimulusSpace[1][frequencyIndex]
+			image = self.renderer.render(
+				size=size,
+				contrast=self.stimulusSpace[0][contrastIndex],
+				frequency=1/self.degreesToPixels(1/frequency),
+				orientation=orientation
+			)
+			if reusable:
+				self.stimulusCache.put(key, image)
+
+		return image
+
+	def prerender(self):
+		'''Renders one more stimulus into the cache ahead of time
+
+			Stimuli are rendered in order of their current information gain, until the cache is full.
+			With random, unquantized orientations there is nothing worth rendering ahead of time.
+
+			Returns:
+				True if there are more stimuli left to render
+		'''
+
+		if self._prerenderQueue is None:
+			if self.orientation is not None:
+				orientations = [self.orientation]
+			elif self.orientationStep is not None:
+				orientations = sorted({(round(o / self.orientationStep) * self.orientationStep) % 360 for o in numpy.arange(0, 360, self.orientationStep)})
+			else:
+				self._prerenderQueue = []
+				return False
+
+			stimulusIndices = numpy.argsort(-self.selectionGain(), kind='stable')
+			stimulusIndices = self.inflateStimulusIndex(stimulusIndices.reshape(-1, 1))
+			self._prerenderQueue = [
+				(contrastIndex, frequencyIndex, orientation)
+				for contrastIndex, frequencyIndex in stimulusIndices
+				for orientation in orientations
+			]
+			self._prerenderQueue.reverse()
+
+		if len(self._prerenderQueue) == 0:
+			return False
+
+		image = self._render(*self._prerenderQueue.pop())
+		if not self.stimulusCache.hasRoomFor(self.renderer.byteCount(image)):
+			logger.debug(f'Stimulus cache is full after pre-rendering {len(self.stimulusCache)} stimuli')
+			self._prerenderQueue = []
+
+		return len(self._prerenderQueue) > 0
+
+class QuickCSFGenerator(GaborGenerator, QuickCSF.QuickCSFEstimator):
+	''' Generate fixed-size stimuli with contrast/spatial frequency determined by QuickCSF
+
+		If orientation is None, random orientations will be generated
+		If selectionBudget_ms is specified, stimulus selection is refined until that much time has passed
+	'''
+
+	def __init__(self,
+		size=100, orientation=None,
+		minContrast=.01, maxContrast=1.0, contrastResolution=24,
+		minFrequency=0.2, maxFrequency=36.0, frequencyResolution=20,
+		degreesToPixels=None, likelihoodCachePath=None, selectionMode='sampled', selectionBudget_ms=None,
+		orientationStep=None, cacheBytes=64*2**20, renderer='qimage'
+	):
+		if selectionBudget_ms is not None:
+			selectionMode = QuickCSF.AnytimeSelection(selectionBudget_ms)
+		elif selectionMode == 'exact' and likelihoodCachePath is None:
+			logger.warning('Exact stimulus selection without a likelihood cache takes seconds per trial; specify likelihoodCachePath')
+
+		super().__init__(
+			size=size, orientation=orientation, degreesToPixels=degreesToPixels, orientationStep=orientationStep, cacheBytes=cacheBytes, renderer=renderer,
+			stimulusSpace=makeStimulusSpace(minContrast, maxContrast, contrastResolution, minFrequency, maxFrequency, frequencyResolution),
+			likelihoodCachePath=likelihoodCachePath,
+			selectionMode=selectionMode
+		)
+
+class ParticleCSFGenerator(GaborGenerator, ParticleCSF.ParticleCSFEstimator):
+	''' Generate fixed-size stimuli with contrast/spatial frequency determined by a particle filter
+
+		If orientation is None, random orientations will be generated
+	'''
+
+	def __init__(self,
+		size=100, orientation=None,
+		minContrast=.01, maxContrast=1.0, contrastResolution=24,
+		minFrequency=0.2, maxFrequency=36.0, frequencyResolution=20,
+		degreesToPixels=None, particleCount=2000, orientationStep=None, cacheBytes=64*2**20, renderer='qimage'
+	):
+		super().__init__(
+			size=size, orientation=orientation, degreesToPixels=degreesToPixels, orientationStep=orientationStep, cacheBytes=cacheBytes, renderer=renderer,
+			stimulusSpace=makeStimulusSpace(minContrast, maxContrast, contrastResolution, minFrequency, maxFrequency, frequencyResolution),
+			particleCount=particleCount
 		)
@@ -24,6 +24,7 @@ from . import CSFController
 from . import QuickCSF
 from . import StimulusGenerators
 from . import screens
+from . import timing
 
 logger = logging.getLogger('QuickCSF.app')
 
@@ -32,7 +33,7 @@ app.setApplicationName('QuickCSF')
 mainWindow = None
 settings = None
 
-def _onFinished(results):
+def _onFinished(results, controller):
 	outputFile = pathlib.Path(settings['outputFile'])
 	logger.debug('Writing output file: ' + str(outputFile.resolve()))
 
@@ -50,20 +51,23 @@ def _onFinished(results):
 
 		writer.writerow(record)
 
+	timing.writeTiming(outputFile, settings['sessionID'], controller.trials, controller.getExpectedDurations())
+
 def _start():
 	global mainWindow, settings
 
 	graph = None
-	def onStateTransition(state, data):
-		if graph is not None and state == 'FEEDBACK':
-			title = f'{settings["sessionID"]}{data.id}'
+	def onResponseMarked(trial, stimulusGenerator):
+		if graph is not None:
+			title = f'{settings["sessionID"]}{trial.id}'
 			graph.clear()
 			graph.set_title(f'Estimated Contrast Sensitivity Function ({title})')
-			plot(controller.stimulusGenerator, graph, show=False)
+			plot(stimulusGenerator, graph, show=False)
 			plt.savefig(pathlib.Path(settings['imagePath']+f'/{title}.png').resolve())
 
+	def onStateTransition(state, data):
 		if state == 'FINISHED':
-			_onFinished(data)
+			_onFinished(data, controller)
 
 	logger.debug('Showing main window')
 
@@ -77,14 +81,23 @@ def _start():
 
 	degreesToPixels = functools.partial(screens.degreesToPixels, distance_mm=settings['distance_mm'])
 
-	stimGenerator = StimulusGenerators.QuickCSFGenerator(degreesToPixels=degreesToPixels, **settings['Stimuli'])
+	stimulusSettings = dict(settings['Stimuli'])
+	particleCount = stimulusSettings.pop('particleCount', None)
+	if particleCount is None:
+		stimGenerator = StimulusGenerators.QuickCSFGenerator(degreesToPixels=degreesToPixels, **stimulusSettings)
+	else:
+		for gridSetting in ['likelihoodCachePath', 'selectionMode', 'selectionBudget_ms']:
+			stimulusSettings.pop(gridSetting, None)
+		stimGenerator = StimulusGenerators.ParticleCSFGenerator(degreesToPixels=degreesToPixels, particleCount=particleCount, **stimulusSettings)
 	controller = CSFController.Controller_2AFC(stimGenerator, **settings['Controller'])
 
 	mainWindow.participantReady.connect(controller.onParticipantReady)
 	mainWindow.participantResponse.connect(controller.onParticipantResponse)
+	mainWindow.displayUpdated.connect(controller.onDisplayUpdated)
 
 	controller.stateTransition.connect(mainWindow.onNewState)
 	controller.stateTransition.connect(onStateTransition)
+	controller.responseMarked.connect(onResponseMarked)
 
 	QtCore.QTimer.singleShot(0, controller.start)
 	mainWindow.showFullScreen()
@@ -142,6 +155,12 @@ def getSettings():
 
 	stimulusSettings.add_argument('--size', type=int, default=3, help='Gabor patch size in (degrees)')
 	stimulusSettings.add_argument('--orientation', type=float, help='Orientation of gabor patch (degrees). If unspecified, each trial will be random')
+	stimulusSettings.add_argument('--orientationStep', type=float, default=None, help='If specified, random orientations are multiples of this many degrees, so rendered stimuli can be reused')
+	stimulusSettings.add_argument('--cacheBytes', type=int, default=64*2**20, help='Memory budget (bytes) for reusing rendered stimuli (0 disables)')
+	stimulusSettings.add_argument('--likelihoodCachePath', default=None, help='If specified, directory in which to build and reuse a precomputed likelihood table (~500 MB)')
+	stimulusSettings.add_argument('--selectionMode', default='sampled', choices=['sampled', 'exact'], help='Estimate stimulus information gain from random parameter samples, or exactly over the full posterior (takes seconds per trial unless --likelihoodCachePath is specified)')
+	stimulusSettings.add_argument('--selectionBudget_ms', type=float, default=None, help='If specified, refine stimulus selection until this many milliseconds have passed (overrides --selectionMode)')
+	stimulusSettings.add_argument('--particleCount', type=int, default=None, help='If specified, estimate the CSF with a particle filter of this many particles instead of the parameter grid')
 
 	settings = argparseqt.groupingTools.parseIntoGroups(parser)
 	if None in [settings['sessionID'], settings['distance_mm']]:
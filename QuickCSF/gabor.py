@@ -0,0 +1,229 @@
+# -*- coding: utf-8 -*
+'''Gabor patches as NumPy arrays, without any Qt dependency
+
+	Suitable for headless rendering (batch jobs, multiprocess pipelines); see `gaborPatch` for QImages
+'''
+
+import math
+import struct
+import zlib
+
+import numpy
+
+# Components closer than this to a (nonzero) integer are recomputed exactly, see `gaborPatchRGBA()`
+TRUNCATION_TOLERANCE = 1e-6
+
+def gaborPatchRGBA(size, orientation, gaussianStd, frequency, phase, color1, color2):
+	'''The r, g, b and a planes (0-255 floats, indexed by [y, x]) of a gabor patch
+
+		Truncating the planes gives exactly the pixels of the original per-pixel QImage loop
+
+		Args:
+			size: the width and height as a factor of the standard deviation
+			orientation: grating orientation in radians, offset by a quarter turn
+			gaussianStd: gaussian smoothing standard deviation in pixels
+			frequency: spatial frequency in cycles per pixel
+			phase: phase shift
+			color1: the first color as an (r, g, b, a) tuple of 0-255 values
+			color2: the second color
+	'''
+
+	# The x,y from the center
+	offsets = numpy.arange(int(size * gaussianStd)) - 0.5 * gaussianStd * size
+	rgba = _gaborComponents(numpy, offsets[numpy.newaxis,:], offsets[:,numpy.newaxis], orientation, gaussianStd, frequency, phase, color1, color2)
+
+	# NumPy's vectorized functions may differ from the C library's in the last bit, which changes the truncated
+	# value of any component sitting on an integer (common at axis-aligned orientations and low contrasts),
+	# so those components are recomputed with the functions the original loop used
+	colorsOnInteger = _onInteger(rgba[0]) | _onInteger(rgba[1]) | _onInteger(rgba[2])
+	alphaOnInteger = _onInteger(rgba[3])
+	for onInteger, planes in [(colorsOnInteger, rgba[:3]), (alphaOnInteger, rgba)]:
+		if onInteger.any():
+			rows, columns = numpy.nonzero(onInteger)
+			exact = _gaborComponents(
+				_libm, offsets[columns], offsets[rows], orientation, gaussianStd, frequency, phase, color1, color2,
+				envelope=planes is rgba
+			)
+			for plane, values in zip(planes, exact):
+				plane[onInteger] = values
+
+	return rgba
+
+def _onInteger(plane):
+	'''Where values of a plane are within `TRUNCATION_TOLERANCE` of a nonzero integer'''
+	nearest = numpy.rint(plane)
+	return (nearest != 0) & (numpy.abs(plane - nearest) < TRUNCATION_TOLERANCE)
+
+def _gaborComponents(functions, dx, dy, orientation, gaussianStd, frequency, phase, color1, color2, envelope=True):
+	'''The r, g, b and a components of gabor patch pixels at the specified offsets from the center
+
+		Args:
+			functions: provides arctan2, sqrt, cos, sin and power, i.e. `numpy` or `_libm`
+			envelope: if False, a is None and the gaussian envelope isn't computed
+	'''
+
+	# The angle of the pixel
+	t = functions.arctan2(dy, dx) + orientation
+
+	# The distance of the pixel from the center
+	distance = functions.sqrt(dx * dx + dy * dy)
+
+	# The coordinates in the unrotated image
+	x = distance * functions.cos(t)
+
+	# The amplitude without envelope (from 0 to 1)
+	amp = 0.5 + 0.5 * functions.cos(phase + math.tau * (x * frequency))
+
+	# color components
+	r = color1[0] * amp + color2[0]*(1-amp)
+	g = color1[1] * amp + color2[1]*(1-amp)
+	b = color1[2] * amp + color2[2]*(1-amp)
+	a = None
+
+	if envelope:
+		y = distance * functions.sin(t)
+
+		# The amplitude of the pixel (from 0 to 1)
+		f = functions.power(math.e, -0.5 * functions.power(x / gaussianStd, 2) - 0.5 * functions.power(y / gaussianStd, 2))
+		a = f * (color1[3] * amp + color2[3] * (1-amp))
+
+	return r, g, b, a
+
+class _libm():
+	'''Element-wise versions of the C library functions the original per-pixel loop called through `math`'''
+
+	def _elementwise(function, argumentCount):
+		ufunc = numpy.frompyfunc(function, argumentCount, 1)
+		return staticmethod(lambda *args: ufunc(*args).astype(numpy.float64))
+
+	arctan2 = _elementwise(math.atan2, 2)
+	# Square roots are correctly rounded everywhere
+	sqrt = staticmethod(numpy.sqrt)
+	cos = _elementwise(math.cos, 1)
+	sin = _elementwise(math.sin, 1)
+	power = _elementwise(pow, 2)
+
+def gaborPatchArray(size=100, orientation=45, gaussianStd=None, frequency=.1, phase=math.tau/4, color1=(255, 255, 255, 255), color2=(0, 0, 0, 255), dtype=numpy.float64):
+	'''Compute the pixels of a gabor patch as an array
+
+		Args:
+			size: the width and height in pixels
+			orientation: grating orientation in degrees
+			gaussianStd: gaussian smoothing standard deviation in pixels
+			frequency: spatial frequency in cycles per pixel
+			phase: phase shift
+			color1: the first color as an (r, g, b, a) tuple of 0-255 values, which need not be integers
+			color2: the second color
+			dtype: the type of the values
+				numpy.uint8: 0-255, truncated exactly as in a gaborPatch QImage
+				other unsigned integer types (e.g. numpy.uint16): rounded to the type's full range, e.g. for high bit-depth displays
+				float types: unquantized 0-1 values
+
+		Returns:
+			(size, size, 4) array of RGBA values, indexed by [y, x]
+	'''
+
+	if gaussianStd is None:
+		gaussianStd = size/8
+
+	rgba = gaborPatchRGBA(size/gaussianStd, (orientation+90) * math.tau / 360, gaussianStd, frequency, phase, color1, color2)
+	rgba = numpy.stack(rgba, axis=-1)
+
+	if dtype == numpy.uint8:
+		return rgba.astype(numpy.uint8)
+	elif numpy.issubdtype(dtype, numpy.integer):
+		return numpy.rint(rgba * (numpy.iinfo(dtype).max / 255)).astype(dtype)
+	else:
+		return (rgba / 255).astype(dtype)
+
+def packARGB32(r, g, b, a, out=None):
+	'''Packs 0-255 color planes into 32-bit ARGB pixels like Qt's qRgba(), truncating each component'''
+
+	out = numpy.left_shift(a.astype(numpy.uint32) & 0xff, 24, out=out)
+	out |= (r.astype(numpy.uint32) & 0xff) << 16
+	out |= (g.astype(numpy.uint32) & 0xff) << 8
+	out |= b.astype(numpy.uint32) & 0xff
+
+	return out
+
+def contrastColors(contrast, quantize=True):
+	'''The light and dark (r, g, b, a) colors of a black-and-white gabor patch with the specified contrast
+
+		Args:
+			contrast: a value between 0-1 indicating how much contrast should be present between dark and light bands
+			quantize: if True, luminances are truncated to integers, as they are for QImages
+	'''
+
+	colors = []
+	for luminance in [255 * (0.5 + 0.5 * contrast), 255 * (0.5 - 0.5 * contrast)]:
+		if quantize:
+			luminance = int(luminance)
+		colors.append((luminance, luminance, luminance, 255))
+
+	return colors
+
+def encodePNG(rgba):
+	'''Encodes a (height, width, 4) uint8 or uint16 RGBA array as PNG bytes'''
+
+	bitDepth = 16 if rgba.dtype == numpy.uint16 else 8
+	rows = numpy.ascontiguousarray(rgba, dtype='>u2' if bitDepth == 16 else numpy.uint8).reshape(rgba.shape[0], -1)
+
+	# Each row is prefixed with a filter type of 0 (none)
+	data = numpy.zeros((rows.shape[0], rows.shape[1] * rows.itemsize + 1), dtype=numpy.uint8)
+	data[:,1:] = rows.view(numpy.uint8)
+
+	def chunk(chunkType, payload):
+		return struct.pack('>I', len(payload)) + chunkType + payload + struct.pack('>I', zlib.crc32(chunkType + payload))
+
+	return b''.join([
+		b'\x89PNG\r\n\x1a\n',
+		chunk(b'IHDR', struct.pack('>IIBBBBB', rgba.shape[1], rgba.shape[0], bitDepth, 6, 0, 0, 0)),
+		chunk(b'IDAT', zlib.compress(data.tobytes())),
+		chunk(b'IEND', b''),
+	])
+
+class ArrayRenderer():
+	'''Renders black-and-white gabor patches as NumPy arrays (or encoded bytes) without Qt'''
+
+	def __init__(self, dtype=numpy.uint8, outputFormat='array'):
+		'''
+			Args:
+				dtype: type of the pixel values, see `gaborPatchArray()`; only numpy.uint8 matches QImages exactly
+				outputFormat: 'array' for (size, size, 4) RGBA arrays, 'raw' for their bytes or 'png' for PNG
+					files (which requires numpy.uint8 or numpy.uint16)
+		'''
+		if outputFormat not in ['array', 'raw', 'png']:
+			raise ValueError(f'Unknown output format: {outputFormat}')
+
+		self.dtype = dtype
+		self.outputFormat = outputFormat
+
+	def render(self, size, contrast, frequency, orientation):
+		color1, color2 = contrastColors(contrast, quantize=(self.dtype == numpy.uint8))
+		rgba = gaborPatchArray(size=size, orientation=orientation, frequency=frequency, color1=color1, color2=color2, dtype=self.dtype)
+
+		if self.outputFormat == 'raw':
+			return rgba.tobytes()
+		elif self.outputFormat == 'png':
+			return encodePNG(rgba)
+		else:
+			return rgba
+
+	def byteCount(self, stimulus):
+		return stimulus.nbytes if isinstance(stimulus, numpy.ndarray) else len(stimulus)
+
+def makeRenderer(renderer='qimage'):
+	'''Creates a renderer by name: 'qimage' (which requires Qt) or 'array'
+
+		Any other object with `render()` and `byteCount()` methods is returned as is
+	'''
+
+	if renderer == 'qimage':
+		from . import gaborPatch
+		return gaborPatch.QImageRenderer()
+	elif renderer == 'array':
+		return ArrayRenderer()
+	elif isinstance(renderer, str):
+		raise ValueError(f'Unknown renderer: {renderer}')
+	else:
+		return renderer
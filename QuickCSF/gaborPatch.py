@@ -3,8 +3,27 @@
 
 import math
 
+import numpy
+
 from qtpy import QtGui
 
+from .gabor import gaborPatchRGBA, packARGB32, contrastColors
+
+def imageArray(image):
+	'''A writable (height, width) uint32 view of the pixels of a 32-bit QImage, without copying'''
+
+	bits = image.bits()
+	if hasattr(bits, 'setsize'):
+		# PyQt returns an unsized pointer
+		bits.setsize(image.height() * image.bytesPerLine())
+
+	return numpy.ndarray(
+		(image.height(), image.width()),
+		dtype=numpy.uint32,
+		buffer=bits,
+		strides=(image.bytesPerLine(), 4)
+	)
+
 class GaborPatchImage(QtGui.QImage):
 	'''Create a gabor patch'''
 
@@ -29,7 +48,7 @@ class GaborPatchImage(QtGui.QImage):
 				color2: the second color
 		'''
 		super().__init__(size, size, QtGui.QImage.Format_ARGB32)
-		
+
 		self.size = size
 		self.orientation = orientation
 		self.gaussianStd = gaussianStd if not gaussianStd is None else size/8
@@ -50,35 +69,16 @@ class GaborPatchImage(QtGui.QImage):
 		self.color1 = self.color1.getRgb()
 		self.color2 = self.color2.getRgb()
 
-		for rx in range(0, int(self.size * self.gaussianStd)):
-			for ry in range(0, int(self.size * self.gaussianStd)):
-				# The x,y from the center
-				dx = rx - 0.5 * self.gaussianStd * self.size
-				dy = ry - 0.5 * self.gaussianStd * self.size
-
-				# The angle of the pixel
-				t = math.atan2(dy, dx) + self.orientation
+		r, g, b, a = gaborPatchRGBA(self.size, self.orientation, self.gaussianStd, self.frequency, self.phase, self.color1, self.color2)
 
-				# The distance of the pixel from the center
-				r = math.sqrt(dx * dx + dy * dy)
-				
-				# The coordinates in the unrotated image
-				x = r * math.cos(t)
-				y = r * math.sin(t)
+		# Pack like qRgba(), truncating each component, straight into the image's memory
+		pixels = imageArray(self)
+		pixelCount = r.shape[0]
+		if pixels.shape != r.shape:
+			pixels[:] = 0
+			pixels = pixels[:pixelCount, :pixelCount]
 
-				# The amplitude without envelope (from 0 to 1)
-				amp = 0.5 + 0.5 * math.cos(self.phase + math.tau * (x * self.frequency))
-
-				# The amplitude of the pixel (from 0 to 1)
-				f = math.e**(-0.5 * pow(x / self.gaussianStd, 2) - 0.5 * pow(y / self.gaussianStd, 2))
-
-				# color components
-				r = self.color1[0] * amp + self.color2[0]*(1-amp)
-				g = self.color1[1] * amp + self.color2[1]*(1-amp)
-				b = self.color1[2] * amp + self.color2[2]*(1-amp)
-				a = f * (self.color1[3] * amp + self.color2[3] * (1-amp))
-
-				self.setPixel(rx, ry, QtGui.qRgba(r, g, b, a))
+		packARGB32(r, g, b, a, out=pixels)
 
 	def __str__(self):
 		return self.__repr__()
@@ -97,11 +97,15 @@ class ContrastGaborPatchImage(GaborPatchImage):
 
 		self.contrast = contrast
 
-		luminance = 255 * (0.5 + 0.5 * contrast)
-		color1 = QtGui.QColor(luminance, luminance, luminance)
-
-		luminance = 255 * (0.5 - 0.5 * contrast)
-		color2 = QtGui.QColor(luminance, luminance, luminance)
+		color1, color2 = [QtGui.QColor(*color) for color in contrastColors(contrast)]
 
 		super().__init__(color1=color1, color2=color2, *args, **kwargs)
 
+class QImageRenderer():
+	'''Renders black-and-white gabor patches as QImages'''
+
+	def render(self, size, contrast, frequency, orientation):
+		return ContrastGaborPatchImage(size=size, contrast=contrast, frequency=frequency, orientation=orientation)
+
+	def byteCount(self, image):
+		return image.bytesPerLine() * image.height()
@@ -0,0 +1,182 @@
+# -*- coding: utf-8 -*
+'''Reconstruct response histories from QuickCSF session logs (see `log.startLog()`)
+
+	Logs are read a line at a time, so archives of any size can be converted into a compact
+	columnar dataset (a NumPy .npz file) which can be fed straight into `replay.replayMany()`.
+
+	Each log may hold several histories: a new one starts whenever an estimator is initialized.
+'''
+
+import logging
+import argparse
+import array
+import csv
+import pathlib
+import re
+
+import numpy
+
+logger = logging.getLogger(__name__)
+
+LOG_NAME_PATTERN = re.compile(r'^QuickCSF (?P<sessionID>.*) (?P<timestamp>\d{4}-\d{2}-\d{2} \d{2}-\d{2}-\d{2})\.log$')
+
+# Written by the estimators' `markResponse()`
+RESPONSE_PATTERN = re.compile(r'Marking response \[*\s*(?P<stimIndex>\d+)\s*\]*\[c=(?P<contrast>[^,]+),f=(?P<frequency>[^\]]+)\] = \[?\s*(?P<response>True|False|1|0)')
+INITIALIZING_PATTERN = re.compile(r'INFO: Initializing (?P<estimator>\w+)$')
+
+class History():
+	'''The responses recorded by one estimator'''
+
+	def __init__(self, path, sessionID, timestamp, estimator):
+		self.path = path
+		self.sessionID = sessionID
+		self.timestamp = timestamp
+		self.estimator = estimator
+
+		self.stimulusIndices = array.array('l')
+		self.contrasts = array.array('d')
+		self.frequencies = array.array('d')
+		self.responses = array.array('b')
+
+	def __len__(self):
+		return len(self.responses)
+
+def parseLog(path):
+	'''Reads the response histories of a session log, one line at a time
+
+		Yields:
+			a History for each estimator which recorded any responses
+	'''
+
+	path = pathlib.Path(path)
+	match = LOG_NAME_PATTERN.match(path.name)
+	sessionID, timestamp = (match['sessionID'], match['timestamp']) if match else (None, None)
+
+	history = None
+	with path.open(errors='replace') as logFile:
+		for line in logFile:
+			if 'Marking response' in line:
+				match = RESPONSE_PATTERN.search(line)
+				if match is None:
+					logger.warning(f'Unrecognized response in {path}: {line.strip()}')
+					continue
+
+				if history is None:
+					# Responses logged without an initialization, e.g. a truncated log
+					history = History(path, sessionID, timestamp, None)
+
+				history.stimulusIndices.append(int(match['stimIndex']))
+				history.contrasts.append(float(match['contrast']))
+				history.frequencies.append(float(match['frequency']))
+				history.responses.append(match['response'] in ('True', '1'))
+
+			elif 'Initializing' in line:
+				match = INITIALIZING_PATTERN.search(line.rstrip())
+				if match is not None:
+					if history is not None and len(history) > 0:
+						yield history
+					history = History(path, sessionID, timestamp, match['estimator'])
+
+	if history is not None and len(history) > 0:
+		yield history
+
+def findLogs(directory):
+	'''Session logs in a directory (and its subdirectories), in name order'''
+	return sorted(pathlib.Path(directory).rglob('QuickCSF *.log'))
+
+def parseLogs(paths):
+	'''Reads the response histories of many session logs, see `parseLog()`'''
+
+	for path in paths:
+		yield from parseLog(path)
+
+def writeDataset(path, histories):
+	'''Writes histories into a columnar .npz file
+
+		Trial columns hold every history's trials back to back; the trials of history i are
+		`offsets[i]:offsets[i+1]`. History columns hold one value per history.
+
+		Returns:
+			the number of histories written
+	'''
+
+	trialColumns = {
+		'stimulusIndex': array.array('l'),
+		'contrast': array.array('d'),
+		'frequency': array.array('d'),
+		'response': array.array('b'),
+	}
+	historyColumns = {'sessionID': [], 'timestamp': [], 'estimator': [], 'path': []}
+	offsets = array.array('q', [0])
+
+	for history in histories:
+		trialColumns['stimulusIndex'].extend(history.stimulusIndices)
+		trialColumns['contrast'].extend(history.contrasts)
+		trialColumns['frequency'].extend(history.frequencies)
+		trialColumns['response'].extend(history.responses)
+		offsets.append(offsets[-1] + len(history))
+
+		historyColumns['sessionID'].append(history.sessionID or '')
+		historyColumns['timestamp'].append(history.timestamp or '')
+		historyColumns['estimator'].append(history.estimator or '')
+		historyColumns['path'].append(str(history.path))
+
+	numpy.savez_compressed(
+		path,
+		offsets=numpy.frombuffer(offsets, dtype=numpy.int64),
+		stimulusIndex=numpy.frombuffer(trialColumns['stimulusIndex'], dtype=numpy.dtype('l')).astype(numpy.int32),
+		contrast=numpy.frombuffer(trialColumns['contrast'], dtype=numpy.float64),
+		frequency=numpy.frombuffer(trialColumns['frequency'], dtype=numpy.float64),
+		response=numpy.frombuffer(trialColumns['response'], dtype=numpy.int8).astype(bool),
+		**{name: numpy.array(values, dtype=str) for name, values in historyColumns.items()}
+	)
+
+	return len(offsets) - 1
+
+def loadDataset(path):
+	'''Loads a dataset written by `writeDataset()` as a dict of arrays'''
+
+	with numpy.load(path) as dataset:
+		return dict(dataset)
+
+def datasetHistories(dataset):
+	'''The (contrasts, frequencies, responses) of every history in a dataset, as accepted by `replay.replayMany()`'''
+
+	offsets = dataset['offsets']
+	for start, stop in zip(offsets[:-1], offsets[1:]):
+		yield dataset['contrast'][start:stop], dataset['frequency'][start:stop], dataset['response'][start:stop]
+
+def main(args=None):
+	parser = argparse.ArgumentParser(prog='python -m QuickCSF.logParser', description='Extract response histories from QuickCSF session logs')
+
+	parser.add_argument('logPath', help='Directory of session logs (searched recursively)')
+	parser.add_argument('-o', '--outputPath', default='histories.npz', help='Columnar .npz file to write the histories to')
+	parser.add_argument('--replayPath', default=None, help='If specified, re-estimate every history and write the results to this CSV file')
+	parser.add_argument('-d', type=float, default=0.5, help='Lapse parameter of the psychometric function used to re-estimate')
+	parser.add_argument('--sig', type=float, default=0.25, help='Slope parameter of the psychometric function used to re-estimate')
+	parser.add_argument('-p', '--processes', type=int, default=None, help='Number of worker processes to re-estimate with (defaults to the number of CPUs)')
+
+	settings = parser.parse_args(args)
+
+	historyCount = writeDataset(settings.outputPath, parseLogs(findLogs(settings.logPath)))
+	logger.info(f'Wrote {historyCount} histories to {settings.outputPath}')
+
+	if settings.replayPath is not None:
+		from . import replay
+
+		dataset = loadDataset(settings.outputPath)
+		with open(settings.replayPath, 'w', newline='') as csvFile:
+			writer = None
+			for record in replay.replayMany(datasetHistories(dataset), processes=settings.processes, d=settings.d, sig=settings.sig):
+				record['sessionID'] = dataset['sessionID'][record['history']]
+				record['timestamp'] = dataset['timestamp'][record['history']]
+				if writer is None:
+					writer = csv.DictWriter(csvFile, fieldnames=record.keys())
+					writer.writeheader()
+				writer.writerow(record)
+
+		logger.info(f'Wrote re-estimated results to {settings.replayPath}')
+
+if __name__ == '__main__':
+	logging.basicConfig(level=logging.INFO)
+	main()
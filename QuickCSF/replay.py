@@ -0,0 +1,119 @@
+# -*- coding: utf-8 -*
+'''Re-estimate CSFs from stored response histories
+
+	e.g. to reanalyse old sessions with a different psychometric function (`d`, `sig`) or stimulus space
+'''
+
+import logging
+import multiprocessing
+
+import numpy
+
+from . import QuickCSF
+
+logger = logging.getLogger(__name__)
+
+def stimulusIndices(stimulusSpace, contrasts, frequencies):
+	'''Flattened indices of the stimuli nearest (in log units) to the specified contrasts and frequencies
+
+		Args:
+			stimulusSpace: [contrasts, frequencies] of the estimator
+			contrasts, frequencies: one value per response
+	'''
+
+	indices = [
+		numpy.abs(numpy.log10(numpy.reshape(values, (-1,1))) - numpy.log10(space).reshape(1,-1)).argmin(axis=1)
+		for space, values in zip(stimulusSpace, [contrasts, frequencies])
+	]
+
+	# Contrast varies fastest in flattened indices
+	return numpy.ravel_multi_index(indices, [len(space) for space in stimulusSpace], order='F')
+
+def historyStimulusSpace(contrasts, frequencies):
+	'''A stimulus space holding exactly the distinct contrasts and frequencies of a history'''
+	return [numpy.unique(contrasts), numpy.unique(frequencies)]
+
+def replay(contrasts, frequencies, responses, stimulusSpace=None, estimator=None, **estimatorSettings):
+	'''Re-estimate a CSF from a stored response history
+
+		Args:
+			contrasts, frequencies, responses: the stimulus and whether the response was correct, for every trial
+			stimulusSpace: the estimator's stimulus space, to which the stimuli are matched (nearest in log units);
+				defaults to the distinct contrasts and frequencies of the history, so nothing is approximated
+			estimator: if specified, a fresh QuickCSFEstimator to use (which sets the stimulus space), instead of creating one
+			estimatorSettings: extra arguments for the QuickCSFEstimator, e.g. `d` and `sig`
+
+		Returns:
+			the estimator, whose posterior reflects every response
+	'''
+
+	if estimator is None:
+		if stimulusSpace is None:
+			stimulusSpace = historyStimulusSpace(contrasts, frequencies)
+		estimator = QuickCSF.QuickCSFEstimator(stimulusSpace, **estimatorSettings)
+
+	estimator.markResponses(stimulusIndices(estimator.stimulusSpace, contrasts, frequencies), responses)
+
+	return estimator
+
+# An estimator for each combination of settings, created once per worker process and forked for every history
+_templates = {}
+
+def _templateKey(value):
+	'''A hashable key for the full contents of settings, unlike repr() which abbreviates large arrays'''
+
+	if isinstance(value, dict):
+		return tuple((name, _templateKey(item)) for name, item in sorted(value.items()))
+	elif isinstance(value, (list, tuple)):
+		return tuple(_templateKey(item) for item in value)
+	elif isinstance(value, numpy.ndarray):
+		return (value.shape, value.dtype.str, value.tobytes())
+	else:
+		return repr(value)
+
+def _replayTask(task):
+	index, (contrasts, frequencies, responses), stimulusSpace, leaveAsIndices, estimatorSettings = task
+
+	if stimulusSpace is None:
+		estimator = None
+	else:
+		key = (_templateKey(stimulusSpace), _templateKey(estimatorSettings))
+		if key not in _templates:
+			_templates[key] = QuickCSF.QuickCSFEstimator(stimulusSpace, **estimatorSettings)
+
+		# Forks share the template's CSF table
+		estimator = _templates[key].fork()
+
+	estimator = replay(contrasts, frequencies, responses, stimulusSpace, estimator, **estimatorSettings)
+
+	record = {'history': index, 'trials': len(responses)}
+	record.update(estimator.getResults(leaveAsIndices))
+
+	return record
+
+def _quietWorker():
+	logging.getLogger('QuickCSF').setLevel(logging.WARNING)
+
+def replayMany(histories, stimulusSpace=None, processes=None, leaveAsIndices=False, **estimatorSettings):
+	'''Re-estimate CSFs from many stored response histories, spread over a pool of processes
+
+		Args:
+			histories: iterable of (contrasts, frequencies, responses) arrays, one per history
+			stimulusSpace: see `replay()`; specifying it allows each process to reuse one estimator's tables for every history
+			processes: number of worker processes, defaults to the number of CPUs
+			leaveAsIndicies: if True, parameter estimates are left as indices, see `QuickCSFEstimator.getResults()`
+			estimatorSettings: extra arguments for each QuickCSFEstimator, e.g. `d` and `sig`
+
+		Yields:
+			a `getResults()` dict for each history, in order, along with:
+				history: index of the history
+				trials: number of responses
+	'''
+
+	tasks = (
+		(index, history, stimulusSpace, leaveAsIndices, estimatorSettings)
+		for index, history in enumerate(histories)
+	)
+
+	with multiprocessing.Pool(processes, initializer=_quietWorker) as pool:
+		yield from pool.imap(_replayTask, tasks, chunksize=4)
@@ -5,19 +5,206 @@ import logging
 import argparse
 import time
 import math
+import os
+import sys
+import csv
+import itertools
+import multiprocessing
 
 import numpy
 
-import matplotlib.pyplot as plt
 import pathlib
-import argparseqt.gui
-import argparseqt.groupingTools
 
 from . import QuickCSF
-from .plot import plot
+from . import BatchCSF
+from . import ParticleCSF
+from . import StimulusGenerators
 
 logger = logging.getLogger('QuickCSF.simulate')
 
+# Field names and types of the per-trial records returned by `simulate()`
+TRIAL_FIELDS = [
+	('stimulusIndex', numpy.int64),
+	('contrast', numpy.float64),
+	('frequency', numpy.float64),
+	('response', numpy.bool_),
+	('nextTime', numpy.float64),
+	('markResponseTime', numpy.float64),
+] + [
+	(name + statistic, numpy.float64) for name in QuickCSF.PARAMETER_NAMES for statistic in ['Mean', 'SD']
+]
+
+def simulateResponse(estimator, unmappedTrueParams, usePerfectResponses=False):
+	'''Simulate an observer's response to the estimator's current stimulus
+
+		Args:
+			unmappedTrueParams: (1, 4) array of the observer's true parameters, in index units
+			usePerfectResponses: if True, respond correctly exactly when the stimulus is above threshold
+	'''
+
+	if usePerfectResponses:
+		logger.debug('Simulating perfect response')
+		stimulusIndices = estimator.inflateStimulusIndex(estimator.currentStimulusIndex)
+		frequency = estimator.stimulusSpace[1][stimulusIndices[:,1]]
+		trueSens = numpy.power(10, QuickCSF.csf_unmapped(unmappedTrueParams, numpy.array([frequency])))
+		testSens = 1 / estimator.stimulusSpace[0][stimulusIndices[:,0]]
+
+		return trueSens > testSens
+	else:
+		logger.debug('Simulating human response response')
+		p = estimator._pmeas(unmappedTrueParams)
+		return estimator.random.random() < p
+
+def simulate(
+	trials=30,
+	usePerfectResponses=False,
+	stimuli={
+		'minContrast':0.01, 'maxContrast':1, 'contrastResolution':24,
+		'minFrequency':.2, 'maxFrequency':36, 'frequencyResolution':20,
+	},
+	parameters={
+		'truePeakSensitivity':18, 'truePeakFrequency':11,
+		'trueBandwidth':12, 'trueDelta':11,
+	},
+	estimator=None,
+	onTrial=None,
+):
+	'''Simulate a QuickCSF experiment without any plotting
+
+		Args:
+			trials: number of trials to simulate
+			usePerfectResponses: whether to simulate perfect responses, rather than probablistic ones
+			stimuli: settings of the stimulus space
+			parameters: the observer's true parameters, in index units
+			estimator: the estimator to use, which must use the same stimulus space;
+				defaults to a QuickCSFEstimator over the stimulus space specified by `stimuli`
+			onTrial: if specified, called with the trial number (from 1) and the estimator after each response
+
+		Returns:
+			dict of:
+				trials: structured array with one record per trial (see `TRIAL_FIELDS`); parameter means and
+					standard deviations of the posterior after each response are in index units and
+					`nextTime`/`markResponseTime` are in seconds
+				results: the final estimates, see `getResults()`
+				trueParameters: the observer's true parameters, as real-world values
+				estimator: the estimator
+	'''
+
+	if estimator is None:
+		estimator = QuickCSF.QuickCSFEstimator(StimulusGenerators.makeStimulusSpace(**stimuli))
+
+	unmappedTrueParams = numpy.array([[
+		parameters['truePeakSensitivity'],
+		parameters['truePeakFrequency'],
+		parameters['trueBandwidth'],
+		parameters['trueDelta'],
+	]])
+
+	records = numpy.zeros(trials, dtype=TRIAL_FIELDS)
+
+	# Trial loop
+	for i in range(trials):
+		# Get the next stimulus
+		startTime = time.perf_counter()
+		stimulus = estimator.next()
+		records['nextTime'][i] = time.perf_counter() - startTime
+
+		response = simulateResponse(estimator, unmappedTrueParams, usePerfectResponses)
+
+		startTime = time.perf_counter()
+		estimator.markResponse(response)
+		records['markResponseTime'][i] = time.perf_counter() - startTime
+
+		records['stimulusIndex'][i] = estimator.currentStimulusIndex.item(0)
+		records['contrast'][i] = stimulus.contrast
+		records['frequency'][i] = stimulus.frequency
+		records['response'][i] = numpy.reshape(response, -1).item(0)
+
+		# The marginal summary is far cheaper than `getResults()`, which also integrates the AULCSF
+		for name, summary in estimator.summarize().items():
+			records[name + 'Mean'][i] = summary['mean']
+			records[name + 'SD'][i] = summary['sd']
+
+		if onTrial is not None:
+			onTrial(i+1, estimator)
+
+	return {
+		'trials': records,
+		'results': estimator.getResults(),
+		'trueParameters': QuickCSF.mapCSFParams(unmappedTrueParams, True).T,
+		'estimator': estimator,
+	}
+
+def simulateBatchResponses(estimator, unmappedTrueParams, usePerfectResponses=False):
+	'''Simulate every session's response to a batch estimator's current stimuli, like `simulateResponse()`
+
+		Args:
+			unmappedTrueParams: (sessionCount, 4) array of each observer's true parameters, in index units
+	'''
+
+	stimulusIndices = estimator.inflateStimulusIndex(estimator.currentStimulusIndex)
+	contrast = estimator.stimulusSpace[0][stimulusIndices[:,0]]
+	frequency = estimator.stimulusSpace[1][stimulusIndices[:,1]]
+
+	# One frequency per row gives each observer's log sensitivity to their own stimulus
+	logSensitivity = QuickCSF.csf_unmapped(unmappedTrueParams, frequency.reshape(-1,1))[:,0]
+
+	if usePerfectResponses:
+		return logSensitivity > numpy.log10(1 / contrast)
+	else:
+		p = QuickCSF.psychometric(logSensitivity, contrast, estimator.d, estimator.sig)
+		return estimator.random.random(len(p)) < p
+
+def simulateBatch(
+	unmappedTrueParams,
+	trials=30,
+	usePerfectResponses=False,
+	stimuli={
+		'minContrast':0.01, 'maxContrast':1, 'contrastResolution':24,
+		'minFrequency':.2, 'maxFrequency':36, 'frequencyResolution':20,
+	},
+	estimator=None,
+):
+	'''Simulate many observers at once with a `BatchQuickCSFEstimator`, without any plotting
+
+		Args:
+			unmappedTrueParams: (sessionCount, 4) array of each observer's true parameters, in index units
+			trials: number of trials to simulate
+			usePerfectResponses: whether to simulate perfect responses, rather than probablistic ones
+			stimuli: settings of the stimulus space
+			estimator: the batch estimator to use, which must have one session per observer;
+				defaults to one over the stimulus space specified by `stimuli`
+
+		Returns:
+			dict of:
+				stimulusIndices, responses: (trials, sessionCount) arrays of the stimuli tested and the responses
+				results: the final estimates of every session, see `BatchQuickCSFEstimator.getResults()`
+				trueParameters: each observer's true parameters as real-world values, one row per session
+				estimator: the estimator
+	'''
+
+	unmappedTrueParams = numpy.reshape(unmappedTrueParams, (-1, 4))
+
+	if estimator is None:
+		estimator = BatchCSF.BatchQuickCSFEstimator(len(unmappedTrueParams), StimulusGenerators.makeStimulusSpace(**stimuli))
+
+	stimulusIndices = numpy.empty((trials, estimator.sessionCount), dtype=numpy.int64)
+	responses = numpy.empty((trials, estimator.sessionCount), dtype=bool)
+
+	for i in range(trials):
+		estimator.next()
+		stimulusIndices[i] = estimator.currentStimulusIndex
+		responses[i] = simulateBatchResponses(estimator, unmappedTrueParams, usePerfectResponses)
+		estimator.markResponse(responses[i])
+
+	return {
+		'stimulusIndices': stimulusIndices,
+		'responses': responses,
+		'results': estimator.getResults(),
+		'trueParameters': QuickCSF.mapCSFParams(unmappedTrueParams, True).T,
+		'estimator': estimator,
+	}
+
 def runSimulation(
 	trials=30,
 	imagePath=None,
@@ -30,18 +217,19 @@ def runSimulation(
 		'truePeakSensitivity':18, 'truePeakFrequency':11,
 		'trueBandwidth':12, 'trueDelta':11,
 	},
+	headless=False,
+	plotEvery=1,
 ):
-	logger.info('Starting simulation')
+	'''Simulate a QuickCSF experiment, printing its history and results
 
-	numpy.random.seed()
+		Args:
+			headless: if True, nothing is plotted (and matplotlib is not needed)
+			plotEvery: the plot is updated every this many trials; if 0, only once the simulation is complete
+	'''
 
-	if imagePath is not None:
-		pathlib.Path(imagePath).mkdir(parents=True, exist_ok=True)
+	logger.info('Starting simulation')
 
-	stimulusSpace = [
-		QuickCSF.makeContrastSpace(stimuli['minContrast'], stimuli['maxContrast'], stimuli['contrastResolution']),
-		QuickCSF.makeFrequencySpace(stimuli['minFrequency'], stimuli['maxFrequency'], stimuli['frequencyResolution'])
-	]
+	numpy.random.seed()
 
 	unmappedTrueParams = numpy.array([[
 		parameters['truePeakSensitivity'],
@@ -49,39 +237,40 @@ def runSimulation(
 		parameters['trueBandwidth'],
 		parameters['trueDelta'],
 	]])
-	qcsf = QuickCSF.QuickCSFEstimator(stimulusSpace)
 
-	graph = plot(qcsf, unmappedTrueParams=unmappedTrueParams)
-
-	# Trial loop
-	for i in range(trials):
-		# Get the next stimulus
-		stimulus = qcsf.next()
-		newStimValues = numpy.array([[stimulus.contrast, stimulus.frequency]])
-
-		# Simulate a response
-		if usePerfectResponses:
-			logger.debug('Simulating perfect response')
-			frequency = newStimValues[:,1]
-			trueSens = numpy.power(10, QuickCSF.csf_unmapped(unmappedTrueParams, numpy.array([frequency])))
-			testContrast = newStimValues[:,0]
-			testSens = 1 / testContrast
-
-			response = trueSens > testSens
-		else:
-			logger.debug('Simulating human response response')
-			p = qcsf._pmeas(unmappedTrueParams)
-			response = numpy.random.rand() < p
-
-		qcsf.markResponse(response)
-
-		# Update the plot
-		graph.clear()
-		graph.set_title(f'Estimated Contrast Sensitivity Function ({i+1})')
-		plot(qcsf, graph, unmappedTrueParams)
+	if headless:
+		onTrial = None
+	else:
+		import matplotlib.pyplot as plt
+		from .plot import plot
 
 		if imagePath is not None:
-			plt.savefig(pathlib.Path(imagePath+'/%f.png' % time.time()).resolve())
+			pathlib.Path(imagePath).mkdir(parents=True, exist_ok=True)
+
+		graph = None
+
+		def updatePlot(trialNumber, qcsf):
+			nonlocal graph
+
+			if graph is None:
+				graph = plot(qcsf, unmappedTrueParams=unmappedTrueParams)
+			else:
+				graph.clear()
+				plot(qcsf, graph, unmappedTrueParams)
+			graph.set_title(f'Estimated Contrast Sensitivity Function ({trialNumber})')
+
+			if imagePath is not None:
+				plt.savefig(pathlib.Path(imagePath+'/%f.png' % time.time()).resolve())
+
+		def onTrial(trialNumber, qcsf):
+			if plotEvery > 0 and trialNumber % plotEvery == 0:
+				updatePlot(trialNumber, qcsf)
+
+	simulation = simulate(trials, usePerfectResponses, stimuli, parameters, onTrial=onTrial)
+	qcsf = simulation['estimator']
+
+	if not headless and (plotEvery == 0 or trials % plotEvery != 0):
+		updatePlot(trials, qcsf)
 
 	logger.info('Simulation complete')
 	print('******* History *******')
@@ -90,29 +279,46 @@ def runSimulation(
 
 	print('***********************')
 
-	paramEstimates = qcsf.getResults()
+	paramEstimates = simulation['results']
 	logger.info('Results: ' + str(paramEstimates))
 
-	trueParams = QuickCSF.mapCSFParams(unmappedTrueParams, True).T
+	trueParams = simulation['trueParameters']
 	print('******* Results *******')
 	print(f'\tEstimates = {paramEstimates}')
 	print(f'\tActuals = {trueParams}')
 	print('***********************')
-	plt.ioff()
-	plt.show()
 
-def entropyPlot(qcsf):
-	params = numpy.arange(qcsf.paramComboCount).reshape(-1, 1)
-	stims = numpy.arange(qcsf.stimComboCount).reshape(-1,1)
+	if not headless:
+		plt.ioff()
+		plt.show()
+
+	return simulation
+
+def gainMap(qcsf, maxBytes=256*2**20, threads=None, chunkSize=1024):
+	'''The information gain of every stimulus under a uniform prior, as a (frequencies, contrasts) array
+
+		Parameter combinations are evaluated in chunks, so memory use stays bounded however large the grid is
+
+		Args:
+			maxBytes: the most memory used at once by the temporaries of all chunks being evaluated
+			threads: number of threads evaluating chunks, defaults to the number of CPUs
+			chunkSize: number of parameter combinations in each chunk; the result depends on this, but not on `threads`
+	'''
+
+	if threads is None:
+		threads = os.cpu_count()
 
-	p = qcsf._pmeas(params, stims)
+	weights = numpy.full(qcsf.paramComboCount, 1/qcsf.paramComboCount)
+	gain = qcsf.informationGain(weights, chunkSize=chunkSize, maxBytes=maxBytes, threads=threads)
 
-	pbar = sum(p)/len(params)
-	hbar = sum(QuickCSF.entropy(p))/len(params)
-	gain = QuickCSF.entropy(pbar)-hbar
+	return gain.reshape(qcsf.stimulusRanges[::-1])
 
+def entropyPlot(qcsf, maxBytes=256*2**20, threads=None):
+	'''Plot the information gain of every stimulus under a uniform prior, see `gainMap()`'''
 
-	gain = -gain.reshape(qcsf.stimulusRanges[::-1]).T
+	import matplotlib.pyplot as plt
+
+	gain = -gainMap(qcsf, maxBytes, threads).T
 
 	fig = plt.figure()
 	graph = fig.add_subplot(1, 1, 1)
@@ -121,17 +327,163 @@ def entropyPlot(qcsf):
 	plt.ioff()
 	plt.show()
 
+# Estimates compared by a sweep, in order
+SWEEP_ESTIMATES = QuickCSF.PARAMETER_NAMES + ['aulcsf']
 
-if __name__ == '__main__':
-	from . import log
-	log.startLog()
+def makeTrueParameters(grid={}, randomCount=0, bounds=QuickCSF.PARAMETER_BOUNDS, randomSource=numpy.random):
+	'''Sets of true parameters (in index units) for a sweep, one per row
 
-	parser = argparse.ArgumentParser()
+		Args:
+			grid: values of each parameter, keyed by parameter name; every combination is included.
+				Parameters which are not specified take the default values of `simulate()`
+			randomCount: number of additional parameter sets, drawn uniformly from within `bounds`
+			randomSource: the numpy.random module or a numpy.random.Generator
+	'''
 
-	parser.add_argument('-n', '--trials', type=int, help='Number of trials to simulate')
-	parser.add_argument('--imagePath', default=None, help='If specified, path to save images')
-	parser.add_argument('-perfect', '--usePerfectResponses', default=False, action='store_true', help='Whether to simulate perfect responses, rather than probablistic ones')
+	defaults = {'peakSensitivity': 18, 'peakFrequency': 11, 'bandwidth': 12, 'delta': 11}
+
+	parameterSets = []
+	if len(grid) > 0 or randomCount == 0:
+		axes = [grid.get(name, [defaults[name]]) for name in QuickCSF.PARAMETER_NAMES]
+		parameterSets.append(numpy.array(list(itertools.product(*axes)), dtype=float).reshape(-1, 4))
+
+	if randomCount > 0:
+		bounds = numpy.array(bounds, dtype=float)
+		parameterSets.append(randomSource.uniform(bounds[:,0], bounds[:,1], (randomCount, len(bounds))))
+
+	return numpy.concatenate(parameterSets)
+
+def _quietWorker():
+	# Per-response log messages from thousands of simulations would swamp the log
+	logging.getLogger('QuickCSF').setLevel(logging.WARNING)
+
+def _sweepTask(task):
+	'''Simulate one session of a sweep, returning a result record for every trial count'''
+
+	parameterSet, repetition, unmappedTrueParams, trialCounts, usePerfectResponses, stimuli, estimatorSettings, seed = task
+
+	randomSource = numpy.random.default_rng(seed)
+	stimulusSpace = StimulusGenerators.makeStimulusSpace(**stimuli)
+	estimatorSettings = dict(estimatorSettings)
+	if estimatorSettings.get('particleCount') is not None:
+		estimator = ParticleCSF.ParticleCSFEstimator(stimulusSpace, randomSource=randomSource, **estimatorSettings)
+	else:
+		estimatorSettings.pop('particleCount', None)
+		estimator = QuickCSF.QuickCSFEstimator(stimulusSpace, randomSource=randomSource, **estimatorSettings)
+
+	trueResults = QuickCSF.mapCSFParams(unmappedTrueParams.reshape(1, -1), True).reshape(4).tolist()
+	trueResults.append(QuickCSF.aulcsf(*trueResults))
+
+	startTime = time.perf_counter()
+	records = []
+
+	def onTrial(trialNumber, estimator):
+		if trialNumber in trialCounts:
+			results = estimator.getResults()
+
+			record = {'parameterSet': parameterSet, 'repetition': repetition, 'trials': trialNumber}
+			for name, trueValue in zip(SWEEP_ESTIMATES, trueResults):
+				record['true_' + name] = trueValue
+				record['estimated_' + name] = results[name]
+
+				# Errors are in log10 units
+				record['error_' + name] = math.log10(results[name]) - math.log10(trueValue)
+			record['elapsed'] = time.perf_counter() - startTime
 
+			records.append(record)
+
+	parameters = {
+		'truePeakSensitivity': unmappedTrueParams[0], 'truePeakFrequency': unmappedTrueParams[1],
+		'trueBandwidth': unmappedTrueParams[2], 'trueDelta': unmappedTrueParams[3],
+	}
+	simulate(max(trialCounts), usePerfectResponses, stimuli, parameters, estimator, onTrial)
+
+	return records
+
+def sweep(
+	outputPath,
+	trueParameters,
+	trialCounts=[50],
+	repetitions=1,
+	usePerfectResponses=False,
+	stimuli={
+		'minContrast':0.01, 'maxContrast':1, 'contrastResolution':24,
+		'minFrequency':.2, 'maxFrequency':36, 'frequencyResolution':20,
+	},
+	estimatorSettings={},
+	seed=None,
+	processes=None,
+):
+	'''Measure how well true parameters are recovered, simulating sessions in a pool of processes
+
+		Every simulated session draws from its own numpy.random.Generator, seeded from `seed`, so a sweep
+		is reproducible however its sessions are distributed between processes. A record for every session
+		and trial count is appended to a CSV file as soon as the session finishes.
+
+		Args:
+			outputPath: CSV file to write
+			trueParameters: (n, 4) array of true parameter sets, in index units, see `makeTrueParameters()`
+			trialCounts: numbers of trials after which the estimates are recorded
+			repetitions: number of sessions simulated for each parameter set
+			usePerfectResponses: whether to simulate perfect responses, rather than probablistic ones
+			stimuli: settings of the stimulus space
+			estimatorSettings: extra arguments for each QuickCSFEstimator, or a ParticleCSFEstimator if they include `particleCount`
+			seed: seed (or numpy.random.SeedSequence) of every session's random numbers; if None, one is chosen and logged
+			processes: number of worker processes, defaults to the number of CPUs
+
+		Returns:
+			dict keyed by trial count, each a dict keyed by estimate name with the bias, rmse and
+			(for the AULCSF) mean absolute error of its log10 errors
+	'''
+
+	if not isinstance(seed, numpy.random.SeedSequence):
+		seed = numpy.random.SeedSequence(seed)
+	logger.info(f'Sweeping {len(trueParameters)} parameter sets x {repetitions} repetitions, seed={seed.entropy}')
+
+	trueParameters = numpy.asarray(trueParameters, dtype=float)
+	trialCounts = sorted(set(trialCounts))
+	taskSeeds = seed.spawn(len(trueParameters) * repetitions)
+
+	tasks = (
+		(parameterSet, repetition, trueParameters[parameterSet], trialCounts, usePerfectResponses, stimuli, estimatorSettings, taskSeeds[parameterSet * repetitions + repetition])
+		for parameterSet in range(len(trueParameters)) for repetition in range(repetitions)
+	)
+
+	errorSums = {trialCount: numpy.zeros((3, len(SWEEP_ESTIMATES))) for trialCount in trialCounts}
+	counts = {trialCount: 0 for trialCount in trialCounts}
+
+	pathlib.Path(outputPath).parent.mkdir(parents=True, exist_ok=True)
+	with open(outputPath, 'w', newline='') as csvFile, multiprocessing.Pool(processes, initializer=_quietWorker) as pool:
+		writer = None
+		for records in pool.imap(_sweepTask, tasks):
+			for record in records:
+				if writer is None:
+					writer = csv.DictWriter(csvFile, fieldnames=record.keys())
+					writer.writeheader()
+				writer.writerow(record)
+
+				errors = numpy.array([record['error_' + name] for name in SWEEP_ESTIMATES])
+				errorSums[record['trials']] += [errors, numpy.square(errors), numpy.abs(errors)]
+				counts[record['trials']] += 1
+
+			csvFile.flush()
+
+	summary = {}
+	for trialCount in trialCounts:
+		meanError, meanSquaredError, meanAbsoluteError = errorSums[trialCount] / max(1, counts[trialCount])
+		summary[trialCount] = {
+			name: {'bias': meanError[i], 'rmse': math.sqrt(meanSquaredError[i])}
+			for i, name in enumerate(SWEEP_ESTIMATES)
+		}
+		summary[trialCount]['aulcsf']['meanAbsoluteError'] = meanAbsoluteError[-1]
+
+		logger.info(f'Recovery after {trialCount} trials: ' + ', '.join(
+			f'{name} bias={values["bias"]:.4f} rmse={values["rmse"]:.4f}' for name, values in summary[trialCount].items()
+		))
+
+	return summary
+
+def _addStimulusArguments(parser):
 	stimuliSettings = parser.add_argument_group('stimuli')
 	stimuliSettings.add_argument('-minc', '--minContrast', type=float, default=.01, help='The lowest contrast value to measure (0.0-1.0)')
 	stimuliSettings.add_argument('-maxc', '--maxContrast', type=float, default=1.0, help='The highest contrast value to measure (0.0-1.0)')
@@ -141,6 +493,68 @@ if __name__ == '__main__':
 	stimuliSettings.add_argument('-maxf', '--maxFrequency', type=float, default=36.0, help='The highest frequency value to measure (cycles per degree)')
 	stimuliSettings.add_argument('-fr', '--frequencyResolution', type=int, default=20, help='The number of frequency steps')
 
+	return stimuliSettings
+
+def sweepMain(args=None):
+	'''Command line interface of `sweep()`, e.g. `python -m QuickCSF.simulate sweep --help`'''
+
+	parser = argparse.ArgumentParser(prog='python -m QuickCSF.simulate sweep', description='Simulate many sessions to measure parameter recovery')
+
+	parser.add_argument('-o', '--outputPath', required=True, help='CSV file to write the results to')
+	parser.add_argument('-n', '--trials', type=int, nargs='+', default=[50], help='Numbers of trials after which to record the estimates')
+	parser.add_argument('-r', '--repetitions', type=int, default=1, help='Number of sessions to simulate for each set of true parameters')
+	parser.add_argument('-perfect', '--usePerfectResponses', default=False, action='store_true', help='Whether to simulate perfect responses, rather than probablistic ones')
+	parser.add_argument('--seed', type=int, default=None, help='Seed of the random numbers, for reproducible sweeps')
+	parser.add_argument('-p', '--processes', type=int, default=None, help='Number of worker processes (defaults to the number of CPUs)')
+	parser.add_argument('--particleCount', type=int, default=None, help='If specified, use a particle filter with this many particles instead of the parameter grid')
+
+	_addStimulusArguments(parser)
+
+	parameterSettings = parser.add_argument_group('true parameters', 'Every combination of the listed values (in index units) is simulated')
+	for name in QuickCSF.PARAMETER_NAMES:
+		parameterSettings.add_argument(f'--{name}', type=float, nargs='+', default=None, help=f'True {name} values (index)')
+	parameterSettings.add_argument('--randomCount', type=int, default=0, help='Number of additional true parameter sets drawn at random from the whole parameter space')
+
+	settings = vars(parser.parse_args(args))
+
+	stimuli = {key: settings[key] for key in ['minContrast', 'maxContrast', 'contrastResolution', 'minFrequency', 'maxFrequency', 'frequencyResolution']}
+	grid = {name: settings[name] for name in QuickCSF.PARAMETER_NAMES if settings[name] is not None}
+
+	seed = numpy.random.SeedSequence(settings['seed'])
+	trueParameters = makeTrueParameters(grid, settings['randomCount'], randomSource=numpy.random.default_rng(seed.spawn(1)[0]))
+
+	summary = sweep(
+		settings['outputPath'],
+		trueParameters,
+		settings['trials'],
+		settings['repetitions'],
+		settings['usePerfectResponses'],
+		stimuli,
+		{'particleCount': settings['particleCount']},
+		seed,
+		settings['processes'],
+	)
+
+	print('******* Recovery (log10 units) *******')
+	for trialCount, estimates in summary.items():
+		print(f'\t{trialCount} trials:')
+		for name, values in estimates.items():
+			print(f'\t\t{name}: ' + ', '.join(f'{key}={value:.4f}' for key, value in values.items()))
+	print('**************************************')
+
+def main():
+	import argparseqt.groupingTools
+
+	parser = argparse.ArgumentParser()
+
+	parser.add_argument('-n', '--trials', type=int, help='Number of trials to simulate')
+	parser.add_argument('--imagePath', default=None, help='If specified, path to save images')
+	parser.add_argument('-perfect', '--usePerfectResponses', default=False, action='store_true', help='Whether to simulate perfect responses, rather than probablistic ones')
+	parser.add_argument('--headless', default=False, action='store_true', help='Skip all plotting')
+	parser.add_argument('--plotEvery', type=int, default=1, help='Update the plot every this many trials (0 to plot only the final estimate)')
+
+	_addStimulusArguments(parser)
+
 	parameterSettings = parser.add_argument_group('parameters')
 	parameterSettings.add_argument('-s', '--truePeakSensitivity', type=int, default=18, help='True peak sensitivity (index)')
 	parameterSettings.add_argument('-f', '--truePeakFrequency', type=int, default=11, help='True peak frequency (index)')
@@ -156,3 +570,12 @@ if __name__ == '__main__':
 
 	if settings is not None:
 		runSimulation(**settings)
+
+if __name__ == '__main__':
+	from . import log
+	log.startLog()
+
+	if sys.argv[1:2] == ['sweep']:
+		sweepMain(sys.argv[2:])
+	else:
+		main()
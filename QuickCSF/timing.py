@@ -0,0 +1,132 @@
+# -*- coding: utf-8 -*
+'''Summaries of presentation timing recorded by the 2AFC controller
+
+	Each trial's `timing` holds:
+		states: (stateName, entered, exited) `time.perf_counter()` times of every state in the trial
+		displayUpdates: (stateName, time) of every display change painted for the trial
+		next: seconds spent generating the trial's stimulus
+		markResponse: seconds spent recording the trial's response
+
+	The last two include work done ahead of time, while waiting for the previous response (see
+	`StimulusGenerators.GaborGenerator.speculate()`), so they reflect the estimator's cost on this machine
+'''
+
+import csv
+import pathlib
+
+import numpy
+
+def stateDurations(trial):
+	'''Actual duration (seconds) of each state of a trial, keyed by state name'''
+	return {name: exited - entered for name, entered, exited in trial.timing['states']}
+
+def displayDurations(trial):
+	'''How long (seconds) each display change of a trial stayed on screen, keyed by state name
+
+		The last display change of a trial has no duration
+	'''
+
+	updates = trial.timing['displayUpdates']
+	return {name: nextTime - time for (name, time), (nextName, nextTime) in zip(updates, updates[1:])}
+
+def onsetLatencies(trial):
+	'''Delay (seconds) between entering each state of a trial and its display change being painted, keyed by state name'''
+
+	entered = {name: enteredTime for name, enteredTime, exited in trial.timing['states']}
+	return {name: time - entered[name] for name, time in trial.timing['displayUpdates'] if name in entered}
+
+def summarize(trials, expectedDurations):
+	'''Summarize the timing errors of every timed state, in milliseconds
+
+		Args:
+			trials: completed trials
+			expectedDurations: intended duration (seconds) of each timed state, keyed by state name
+
+		Returns:
+			dict keyed by state name, each a dict of:
+				count: number of measurements
+				mean: mean (signed) error
+				p95, max: 95th percentile and maximum of the absolute error
+				displayMean, displayP95, displayMax: the same for how long the state's display change was on screen
+	'''
+
+	summary = {}
+	for name, expected in expectedDurations.items():
+		stateErrors = [durations[name] - expected for durations in map(stateDurations, trials) if name in durations]
+		displayErrors = [durations[name] - expected for durations in map(displayDurations, trials) if name in durations]
+		onsets = [latencies[name] for latencies in map(onsetLatencies, trials) if name in latencies]
+
+		if len(stateErrors) == 0:
+			continue
+
+		summary[name] = {'count': len(stateErrors), **_errorSummary(stateErrors)}
+		summary[name].update({'display' + key[0].upper() + key[1:]: value for key, value in _errorSummary(displayErrors).items()})
+		summary[name].update({'onset' + key[0].upper() + key[1:]: value for key, value in _errorSummary(onsets).items()})
+
+	return summary
+
+def _errorSummary(errors):
+	if len(errors) == 0:
+		return {'mean': numpy.nan, 'p95': numpy.nan, 'max': numpy.nan}
+
+	errors = numpy.array(errors) * 1000
+	return {
+		'mean': errors.mean(),
+		'p95': numpy.percentile(numpy.abs(errors), 95),
+		'max': numpy.abs(errors).max(),
+	}
+
+def timingPaths(resultsPath):
+	'''The per-trial and summary timing files which accompany a results file'''
+
+	resultsPath = pathlib.Path(resultsPath)
+	return (
+		resultsPath.with_name(resultsPath.stem + '-timing' + resultsPath.suffix),
+		resultsPath.with_name(resultsPath.stem + '-timing-summary' + resultsPath.suffix),
+	)
+
+def _appendRecords(path, records):
+	if len(records) == 0:
+		return
+
+	fileExists = path.exists()
+	with path.open('a', newline='') as csvFile:
+		writer = csv.DictWriter(csvFile, fieldnames=records[0].keys())
+		if not fileExists:
+			writer.writeheader()
+
+		writer.writerows(records)
+
+def writeTiming(resultsPath, sessionID, trials, expectedDurations):
+	'''Append per-trial timing and its summary to CSV files alongside the results file
+
+		Durations are in milliseconds
+	'''
+
+	trialPath, summaryPath = timingPaths(resultsPath)
+
+	records = []
+	for trial in trials:
+		states = stateDurations(trial)
+		displays = displayDurations(trial)
+		onsets = onsetLatencies(trial)
+
+		record = {'SessionID': sessionID, 'Trial': trial.id}
+		for name in expectedDurations:
+			record[name] = states.get(name, numpy.nan) * 1000
+			record[name + ' (display)'] = displays.get(name, numpy.nan) * 1000
+			record[name + ' (onset)'] = onsets.get(name, numpy.nan) * 1000
+
+		record['stimulusWait'] = trial.stimulusWait * 1000
+		for key in ['next', 'markResponse']:
+			record[key] = numpy.nan if trial.timing[key] is None else trial.timing[key] * 1000
+
+		records.append(record)
+
+	_appendRecords(trialPath, records)
+
+	summary = summarize(trials, expectedDurations)
+	_appendRecords(summaryPath, [
+		{'SessionID': sessionID, 'State': name, 'Expected': expectedDurations[name] * 1000, **stateSummary}
+		for name, stateSummary in summary.items()
+	])
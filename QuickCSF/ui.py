@@ -7,8 +7,7 @@ import math, time
 
 import numpy
 
-from qtpy import QtCore, QtGui, QtWidgets, QtMultimedia
-import argparseqt.gui
+from qtpy import QtCore, QtGui, QtWidgets
 
 from . import assets
 
@@ -21,25 +20,92 @@ If the striped circle appeared during the SECOND tone, press [ RIGHT → ].\n\n
 Throughout the test, keep your gaze fixated on the circled-dot at the center of the screen.\n\n
 If you are uncertain, make a guess.\n\n\nPress [ SPACEBAR ] to start.'''
 
+class StimulusDisplay(QtWidgets.QWidget):
+	'''Paints text, a stimulus pixmap or a blank screen
+
+		Unlike a QLabel, changing what is shown never triggers a re-layout, and the widget is repainted
+		immediately rather than when the event loop gets around to it
+	'''
+
+	# The `time.perf_counter()` time after each paint
+	painted = QtCore.Signal(float)
+
+	def __init__(self, parent=None):
+		super().__init__(parent)
+		self.setAttribute(QtCore.Qt.WA_OpaquePaintEvent)
+
+		self.background = QtGui.QColor(127, 127, 127)
+		self.foreground = QtGui.QColor('#bbb')
+		self.margin = 100
+
+		font = self.font()
+		font.setPointSize(28)
+		self.setFont(font)
+
+		self.text = ''
+		self.pixmap = None
+
+	def setText(self, text):
+		self.text = text
+		self.pixmap = None
+		self.repaint()
+
+	def setPixmap(self, pixmap):
+		self.text = ''
+		self.pixmap = pixmap
+		self.repaint()
+
+	def clear(self):
+		self.setText('')
+
+	def paintEvent(self, event):
+		painter = QtGui.QPainter(self)
+		painter.fillRect(self.rect(), self.background)
+
+		if self.pixmap is not None:
+			painter.drawPixmap(
+				(self.width() - self.pixmap.width()) // 2,
+				(self.height() - self.pixmap.height()) // 2,
+				self.pixmap
+			)
+		elif self.text != '':
+			painter.setPen(self.foreground)
+			painter.drawText(
+				self.rect().adjusted(self.margin, self.margin, -self.margin, -self.margin),
+				QtCore.Qt.AlignCenter | QtCore.Qt.TextWordWrap,
+				self.text
+			)
+
+		painter.end()
+		self.painted.emit(time.perf_counter())
+
 class QuickCSFWindow(QtWidgets.QMainWindow):
 	'''The main window for QuickCSF.app'''
 
 	participantReady = QtCore.Signal()
 	participantResponse = QtCore.Signal(object)
 
-	def __init__(self, instructions=None, parent=None):
+	# The state name and `time.perf_counter()` time whenever the display has been painted for a new state
+	displayUpdated = QtCore.Signal(object, float)
+
+	def __init__(self, instructions=None, parent=None, sounds=None):
+		'''Create the main window
+
+			Args:
+				instructions: text shown before the first trial, defaults to `DEFAULT_INSTRUCTIONS`
+				sounds: objects with a `play()` method, keyed by 'tone', 'good' and 'bad';
+					defaults to QSounds of the bundled assets (which needs QtMultimedia)
+		'''
 		super().__init__(parent)
-		self.displayWidget = QtWidgets.QLabel(self)
-		self.displayWidget.setAlignment(QtCore.Qt.AlignCenter)
-		self.displayWidget.setWordWrap(True)
-		self.displayWidget.setMargin(100)
-		self.displayWidget.setStyleSheet(
-			'''
-				background: rgb(127, 127, 127);
-				color: #bbb;
-				font-size: 28pt;
-			'''
-		)
+		self.displayWidget = StimulusDisplay(self)
+		self.displayWidget.painted.connect(self._onPainted)
+
+		# The state whose display change has yet to be painted
+		self._unpaintedState = None
+
+		# The upcoming stimulus, converted to a pixmap ahead of its onset
+		self._preparedStimulus = None
+		self._preparedPixmap = None
 
 		self.instructionsText = instructions if instructions is not None else DEFAULT_INSTRUCTIONS
 
@@ -49,11 +115,13 @@ class QuickCSFWindow(QtWidgets.QMainWindow):
 		self.finishedText = 'All done!'
 
 		self.setCentralWidget(self.displayWidget)
-		self.sounds = {
-			'tone': QtMultimedia.QSound(assets.locate('tone.wav')),
-			'good': QtMultimedia.QSound(assets.locate('good.wav')),
-			'bad': QtMultimedia.QSound(assets.locate('bad.wav')),
-		}
+
+		if sounds is None:
+			# Imported here so the window can be used without audio support (e.g. on the offscreen platform)
+			from qtpy import QtMultimedia
+			sounds = {name: QtMultimedia.QSound(assets.locate(f'{name}.wav')) for name in ['tone', 'good', 'bad']}
+
+		self.sounds = sounds
 
 	def showInstructions(self):
 		self.displayWidget.setText(self.instructionsText)
@@ -64,8 +132,16 @@ class QuickCSFWindow(QtWidgets.QMainWindow):
 	def showFixationCross(self):
 		self.displayWidget.setText('+')
 
+	def prepareStimulus(self, stimulus):
+		'''Convert a stimulus image to a pixmap ahead of time, so that showing it only needs to draw it'''
+
+		if stimulus is not None and stimulus is not self._preparedStimulus:
+			self._preparedStimulus = stimulus
+			self._preparedPixmap = QtGui.QPixmap.fromImage(stimulus)
+
 	def showStimulus(self, stimulus):
-		self.displayWidget.setPixmap(QtGui.QPixmap.fromImage(stimulus))
+		self.prepareStimulus(stimulus)
+		self.displayWidget.setPixmap(self._preparedPixmap)
 		self.sounds['tone'].play()
 
 	def showNonStimulus(self):
@@ -76,8 +152,7 @@ class QuickCSFWindow(QtWidgets.QMainWindow):
 		self.displayWidget.setText('')
 
 	def showBlank(self):
-		self.displayWidget.setText('')
-		self.displayWidget.setPixmap(None)
+		self.displayWidget.clear()
 
 	def giveFeedback(self, good):
 		if good:
@@ -112,6 +187,8 @@ class QuickCSFWindow(QtWidgets.QMainWindow):
 	def onNewState(self, stateName, data):
 		logger.debug(f'New state: {stateName} [{data}]')
 
+		self._unpaintedState = stateName
+
 		if stateName == 'INSTRUCTIONS':
 			self.showInstructions()
 		elif stateName == 'BREAKING':
@@ -120,6 +197,7 @@ class QuickCSFWindow(QtWidgets.QMainWindow):
 			self.showReadyPrompt()
 		elif 'FIXATION' in stateName:
 			self.showFixationCross()
+			self.prepareStimulus(data.stimulus)
 		elif '_BLANK' in stateName:
 			self.showBlank()
 		elif stateName == 'SHOW_STIMULUS_1':
@@ -143,8 +221,15 @@ class QuickCSFWindow(QtWidgets.QMainWindow):
 		elif stateName == 'FINISHED':
 			self.showFinished(data)
 
+	def _onPainted(self, timestamp):
+		if self._unpaintedState is not None:
+			self.displayUpdated.emit(self._unpaintedState, timestamp)
+			self._unpaintedState = None
+
 def getSettings(parser, settings, requiredFields=[]):
 	'''Display a GUI to collect experiment settings'''
+	import argparseqt.gui
+
 	dialog = argparseqt.gui.ArgDialog(parser)
 	dialog.setValues(settings)
 	dialog.exec_()
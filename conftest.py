@@ -0,0 +1 @@
+'''Lets the tests import QuickCSF from the source tree'''
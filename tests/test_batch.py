@@ -0,0 +1,51 @@
+'''The batch estimator, against per-session computations'''
+
+import numpy
+
+from QuickCSF import QuickCSF, BatchCSF, simulate
+
+def makeBatch(sessionCount, **settings):
+	'''A batch over a coarse parameter grid, small enough for many sessions'''
+	return BatchCSF.BatchQuickCSFEstimator(
+		sessionCount, parameterSpace=QuickCSF.makeParameterSpace((5, 4, 3, 3)),
+		randomSource=numpy.random.default_rng(0), **settings
+	)
+
+def test_simulateBatchResponsesAboveChunkSize():
+	'''More sessions than `csf()` evaluates at once, each responding to its own stimulus'''
+	sessionCount = QuickCSF.CSF_CHUNK_SIZE + 100
+	random = numpy.random.default_rng(1)
+	unmappedTrueParams = random.uniform(0, 20, (sessionCount, 4))
+
+	estimator = makeBatch(sessionCount)
+	estimator.currentStimulusIndex = random.integers(estimator.stimComboCount, size=sessionCount)
+	responses = simulate.simulateBatchResponses(estimator, unmappedTrueParams, usePerfectResponses=True)
+
+	# Each observer's responses, from every observer's sensitivity at every frequency
+	logSensitivity = QuickCSF.csf_unmapped(unmappedTrueParams, estimator.stimulusSpace[1].reshape(1,-1))
+	contrastIndices, frequencyIndices = estimator.inflateStimulusIndex(estimator.currentStimulusIndex).T
+	expected = logSensitivity[numpy.arange(sessionCount), frequencyIndices] > numpy.log10(1 / estimator.stimulusSpace[0][contrastIndices])
+
+	assert numpy.array_equal(responses, expected)
+
+	estimator.markResponse(responses)
+	assert numpy.isfinite(estimator.logPosterior).all()
+
+def test_markResponseMatchesSingleEstimators():
+	'''Sessions sharing stimuli and responses or not, against one QuickCSFEstimator each'''
+	sessionCount = 6
+	batch = makeBatch(sessionCount)
+	estimators = [QuickCSF.QuickCSFEstimator(batch.stimulusSpace, parameterSpace=batch.parameterSpace) for i in range(sessionCount)]
+
+	random = numpy.random.default_rng(2)
+	for trial in range(10):
+		stimIndices = random.integers(3, size=sessionCount) * 7
+		responses = random.random(sessionCount) < .6
+
+		batch.markResponse(responses, stimIndices)
+		for estimator, stimIndex, response in zip(estimators, stimIndices, responses):
+			estimator.markResponse(response, stimIndex)
+
+	probabilities = batch.probabilities()
+	for session, estimator in enumerate(estimators):
+		assert numpy.allclose(probabilities[session], estimator.probabilities[:,0], rtol=1e-12, atol=1e-300)
@@ -0,0 +1,99 @@
+'''The in-place CSF evaluation against the original repeat()-based implementation'''
+
+from collections.abc import Iterable
+
+import numpy
+import pytest
+
+from QuickCSF import QuickCSF
+
+def baselineCSF(peakSensitivity, peakFrequency, logBandwidth, delta, frequency):
+	'''`QuickCSF.csf()` as it was before it was evaluated in place'''
+	frequency = numpy.log10(frequency)
+
+	if not isinstance(peakSensitivity, Iterable):
+		delta = numpy.log10(peakSensitivity) - numpy.log10(peakSensitivity-delta)
+		delta = numpy.array([delta])
+
+		peakSensitivity = numpy.array([numpy.log10(peakSensitivity)])
+		peakFrequency = numpy.array([numpy.log10(peakFrequency)])
+		logBandwidth = numpy.array([numpy.log10(logBandwidth)])
+
+		frequency = numpy.array([[frequency]])
+
+	n = len(peakSensitivity)
+	m = len(frequency[0])
+
+	frequency = frequency.repeat(n, 0)
+
+	peakFrequency = peakFrequency[:,numpy.newaxis].repeat(m,1)
+	peakSensitivity = peakSensitivity[:,numpy.newaxis].repeat(m,1)
+	delta = delta[:,numpy.newaxis].repeat(m,1)
+
+	divisor = numpy.log10(2)+logBandwidth
+	divisor = divisor[:,numpy.newaxis].repeat(m,1)
+	truncation = (4 * numpy.log10(2) * numpy.power(numpy.divide(frequency-peakFrequency, divisor), 2))
+
+	logSensitivity = numpy.maximum(0, peakSensitivity - truncation)
+	Scutoff = numpy.maximum(logSensitivity, peakSensitivity-delta)
+	logSensitivity[frequency<peakFrequency] = Scutoff[frequency<peakFrequency]
+
+	return logSensitivity
+
+def baselineAULCSF(peakSensitivity, peakFrequency, logBandwidth, delta, bucketWidth=.1):
+	'''`QuickCSF.aulcsf()` as it was before scalars skipped the array path'''
+	gonePositive = False
+	frequency = 0
+	area = 0
+	while True:
+		frequency += bucketWidth
+		height = baselineCSF(peakSensitivity, peakFrequency, logBandwidth, delta, frequency)[0][0]
+		if height > 0:
+			gonePositive = True
+
+		if gonePositive and height <= 0:
+			return area
+		area += height * bucketWidth
+
+@pytest.fixture(scope='module')
+def parameters():
+	'''Every 7th combination of the default parameter grid, unmapped'''
+	grid = numpy.meshgrid(*QuickCSF.makeParameterSpace(), indexing='ij')
+	return numpy.stack([axis.reshape(-1)[::7] for axis in grid], axis=1)
+
+def test_csfMatchesBaseline(parameters):
+	frequency = QuickCSF.makeFrequencySpace().reshape(1,-1)
+	expected = baselineCSF(*QuickCSF.mapCSFParams(parameters), frequency)
+
+	assert numpy.array_equal(QuickCSF.csf_unmapped(parameters, frequency), expected)
+	assert numpy.array_equal(QuickCSF.csf_unmapped(parameters, frequency, chunkSize=1000), expected)
+	assert numpy.array_equal(QuickCSF.csf_unmapped(parameters, frequency, chunkSize=None), expected)
+
+def test_csfWithFrequencyPerRow(parameters):
+	'''One frequency per parameter row, over more rows than a chunk'''
+	assert len(parameters) > QuickCSF.CSF_CHUNK_SIZE
+
+	frequencySpace = QuickCSF.makeFrequencySpace()
+	columns = numpy.arange(len(parameters)) % len(frequencySpace)
+	expected = baselineCSF(*QuickCSF.mapCSFParams(parameters), frequencySpace.reshape(1,-1))[numpy.arange(len(parameters)), columns]
+
+	logSensitivity = QuickCSF.csf_unmapped(parameters, frequencySpace[columns].reshape(-1,1))
+
+	assert logSensitivity.shape == (len(parameters), 1)
+	assert numpy.array_equal(logSensitivity[:,0], expected)
+
+def test_estimatorTableMatchesBaseline():
+	estimator = QuickCSF.QuickCSFEstimator(parameterSpace=QuickCSF.makeParameterSpace((7, 6, 5, 4)))
+	expected = baselineCSF(*estimator.mappedParameters, estimator.stimulusSpace[1].reshape(1,-1))
+
+	assert numpy.array_equal(estimator.csfTable, expected)
+
+@pytest.mark.parametrize('parameters', [
+	(100, 2, 3, .5),
+	(10, 1, 1.5, 5),
+	(400, 8, 2, 200),
+	(2.5, .5, 5, 1),
+])
+def test_aulcsfMatchesBaseline(parameters):
+	assert QuickCSF.aulcsf(*parameters) == baselineAULCSF(*parameters)
+	assert QuickCSF._csfScalar(*parameters, 3.) == baselineCSF(*parameters, 3.)[0][0]
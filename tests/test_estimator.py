@@ -0,0 +1,34 @@
+'''The grid estimator and its posterior'''
+
+import numpy
+
+from QuickCSF import QuickCSF, simulate
+
+def test_float32PosteriorExponentiatesInFloat64():
+	posterior = QuickCSF.LogPosterior(3, dtype=numpy.float32)
+	posterior.addLogLikelihoods(numpy.array([-3.3, 0, -1], dtype=numpy.float32))
+
+	expected = numpy.exp(posterior.logProbabilities.astype(numpy.float64))
+	assert numpy.array_equal(posterior.probabilities()[:,0], expected / expected.sum())
+
+def test_refineWidensTowardTruthOutsideGrid():
+	'''A grid refined around misleading early responses, so peak sensitivity can't reach the truth'''
+	parameterSpace = QuickCSF.makeParameterSpace((14, 11, 11, 11))
+	parameterSpace[0] = numpy.linspace(15, 27, 14)
+	estimator = QuickCSF.QuickCSFEstimator(parameterSpace=parameterSpace, refineInterval=5, randomSource=numpy.random.default_rng(0))
+
+	unmappedTrueParams = numpy.array([[6, 11, 12, 11]])
+	for trial in range(20):
+		estimator.next()
+		estimator.markResponse(simulate.simulateResponse(estimator, unmappedTrueParams, usePerfectResponses=True))
+
+	peakSensitivities = estimator.parameterSpace[0]
+	assert peakSensitivities[0] <= 6 <= peakSensitivities[-1]
+	assert estimator.summarize()['peakSensitivity']['mean'] < parameterSpace[0][0]
+
+def test_gainMapDoesNotDependOnThreads():
+	estimator = QuickCSF.QuickCSFEstimator(parameterSpace=QuickCSF.makeParameterSpace((10, 8, 8, 8)))
+
+	gain = simulate.gainMap(estimator, maxBytes=2**26, threads=1, chunkSize=256)
+	for threads in [2, 3, 8]:
+		assert numpy.array_equal(simulate.gainMap(estimator, maxBytes=2**26, threads=threads, chunkSize=256), gain)
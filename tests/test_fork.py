@@ -0,0 +1,67 @@
+'''Speculative branches of the estimators, and what they log'''
+
+import logging
+
+import numpy
+import pytest
+
+from QuickCSF import QuickCSF, ParticleCSF
+
+ESTIMATORS = {
+	# Refining every other trial, so branches also refine the grid
+	'grid': lambda: QuickCSF.QuickCSFEstimator(parameterSpace=QuickCSF.makeParameterSpace((8, 6, 5, 5)), refineInterval=2, refineMass=.5,
+		randomSource=numpy.random.default_rng(0)),
+	'particle': lambda: ParticleCSF.ParticleCSFEstimator(particleCount=200, randomSource=numpy.random.default_rng(0)),
+}
+
+def loggedMessages(caplog):
+	return [record.getMessage() for record in caplog.records if record.levelno == logging.INFO]
+
+def markBranch(estimator):
+	'''Marks two responses on a fork of the estimator, returning it'''
+	branch = estimator.fork()
+	for response in [True, False]:
+		branch.next()
+		branch.markResponse(response)
+
+	return branch
+
+@pytest.mark.parametrize('name', ESTIMATORS)
+def test_discardedBranchLogsNothing(name, caplog):
+	estimator = ESTIMATORS[name]()
+	estimator.next()
+
+	caplog.set_level(logging.INFO, logger='QuickCSF')
+	branch = markBranch(estimator)
+	assert len(branch.stimulusIndexHistory) == 2
+
+	assert loggedMessages(caplog) == []
+	assert estimator.stimulusIndexHistory == []
+
+@pytest.mark.parametrize('name', ESTIMATORS)
+def test_adoptedBranchLogsOnce(name, caplog):
+	estimator = ESTIMATORS[name]()
+	estimator.next()
+
+	caplog.set_level(logging.INFO, logger='QuickCSF')
+	branch = markBranch(estimator)
+	deferred = list(branch.deferredLog)
+
+	# Adopting a fork of the branch keeps its messages deferred until the branch itself is adopted
+	subBranch = markBranch(branch)
+	branch.adopt(subBranch)
+	assert loggedMessages(caplog) == []
+
+	estimator.adopt(branch)
+	messages = loggedMessages(caplog)
+	assert messages == deferred + subBranch.deferredLog
+	assert len([message for message in messages if message.startswith('Marking response')]) == 4
+	if name == 'grid':
+		assert any(message.startswith('Refining parameter grid') for message in messages)
+
+	assert len(estimator.stimulusIndexHistory) == 4
+	assert estimator.deferredLog is None
+
+	# Nothing is logged again
+	estimator.markResponse(True)
+	assert len(loggedMessages(caplog)) == len(messages) + 1
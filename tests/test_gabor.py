@@ -0,0 +1,77 @@
+'''Vectorized gabor patches against the original per-pixel loop'''
+
+import math
+import os
+
+import numpy
+import pytest
+
+from QuickCSF import gabor
+
+def qRgba(r, g, b, a):
+	'''Qt's qRgba(), truncating float components as older PyQt versions did'''
+	return ((int(a) & 0xff) << 24) | ((int(r) & 0xff) << 16) | ((int(g) & 0xff) << 8) | (int(b) & 0xff)
+
+def baselinePixels(size, orientation, frequency, contrast, phase=math.tau/4):
+	'''The pixels of a ContrastGaborPatchImage as `GaborPatchImage.setPixels()` computed them one at a time'''
+
+	gaussianStd = size/8
+	orientation = (orientation+90) * math.tau / 360
+	size = size / gaussianStd
+
+	# QColor truncates luminances
+	luminance = int(255 * (0.5 + 0.5 * contrast))
+	color1 = (luminance, luminance, luminance, 255)
+	luminance = int(255 * (0.5 - 0.5 * contrast))
+	color2 = (luminance, luminance, luminance, 255)
+
+	pixels = numpy.zeros((int(size * gaussianStd),)*2, dtype=numpy.uint32)
+	for rx in range(0, int(size * gaussianStd)):
+		for ry in range(0, int(size * gaussianStd)):
+			dx = rx - 0.5 * gaussianStd * size
+			dy = ry - 0.5 * gaussianStd * size
+
+			t = math.atan2(dy, dx) + orientation
+			r = math.sqrt(dx * dx + dy * dy)
+
+			x = r * math.cos(t)
+			y = r * math.sin(t)
+
+			amp = 0.5 + 0.5 * math.cos(phase + math.tau * (x * frequency))
+			f = math.e**(-0.5 * pow(x / gaussianStd, 2) - 0.5 * pow(y / gaussianStd, 2))
+
+			r = color1[0] * amp + color2[0]*(1-amp)
+			g = color1[1] * amp + color2[1]*(1-amp)
+			b = color1[2] * amp + color2[2]*(1-amp)
+			a = f * (color1[3] * amp + color2[3] * (1-amp))
+
+			# QImage.setPixel(x, y, ...)
+			pixels[ry, rx] = qRgba(r, g, b, a)
+
+	return pixels
+
+PATCHES = [
+	(32, 45, .1, 1),
+	(33, 0, .05, .5),
+	(40, 90, .2, .0123),
+	(48, 135, .3, .004),
+	(24, 180, .1, .001),
+]
+
+@pytest.mark.parametrize('size, orientation, frequency, contrast', PATCHES)
+def test_arrayMatchesBaseline(size, orientation, frequency, contrast):
+	gaussianStd = size/8
+	color1, color2 = gabor.contrastColors(contrast)
+	rgba = gabor.gaborPatchRGBA(size/gaussianStd, (orientation+90) * math.tau / 360, gaussianStd, frequency, math.tau/4, color1, color2)
+
+	assert numpy.array_equal(gabor.packARGB32(*rgba), baselinePixels(size, orientation, frequency, contrast))
+
+@pytest.mark.parametrize('size, orientation, frequency, contrast', PATCHES)
+def test_imageMatchesBaseline(size, orientation, frequency, contrast):
+	os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+	pytest.importorskip('qtpy.QtGui')
+	from QuickCSF import gaborPatch
+
+	image = gaborPatch.ContrastGaborPatchImage(size=size, orientation=orientation, frequency=frequency, contrast=contrast)
+
+	assert numpy.array_equal(gaborPatch.imageArray(image), baselinePixels(size, orientation, frequency, contrast))
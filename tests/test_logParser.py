@@ -0,0 +1,49 @@
+'''Reading session logs into datasets, and replaying them'''
+
+import pathlib
+
+import numpy
+
+from QuickCSF import QuickCSF, logParser, replay
+
+DATA_PATH = pathlib.Path(__file__).parent / 'data'
+
+# The two sessions in the fixture log, run over this grid, and the results they reported
+PARAMETER_SPACE = QuickCSF.makeParameterSpace((8, 6, 5, 5))
+LIVE_RESULTS = [
+	{'peakSensitivity': 16.16430487779804, 'peakFrequency': 1.962656604373504, 'bandwidth': 3.137566627921526, 'delta': 5.891880507256133, 'aulcsf': 8.522564871023171},
+	{'peakSensitivity': 15.55455050395079, 'peakFrequency': 1.664819357373859, 'bandwidth': 3.0274323201305124, 'delta': 5.827980367658705, 'aulcsf': 6.847716541225728},
+]
+
+def test_parseLogRoundTrip(tmp_path):
+	paths = logParser.findLogs(DATA_PATH)
+	assert [path.name for path in paths] == ['QuickCSF fixture 2026-01-01 09-30-00.log']
+
+	histories = list(logParser.parseLogs(paths))
+	assert len(histories) == len(LIVE_RESULTS)
+
+	stimulusSpace = [QuickCSF.makeContrastSpace(.0001, .05), QuickCSF.makeFrequencySpace()]
+	for history in histories:
+		assert (history.sessionID, history.timestamp) == ('fixture', '2026-01-01 09-30-00')
+		assert history.estimator == 'QuickCSFEStimator'
+		assert len(history) == 12
+
+		# Logged stimuli are exact, so they match the stimulus space the indices were logged for
+		assert list(replay.stimulusIndices(stimulusSpace, history.contrasts, history.frequencies)) == list(history.stimulusIndices)
+
+	datasetPath = tmp_path / 'histories.npz'
+	assert logParser.writeDataset(datasetPath, histories) == len(histories)
+	dataset = logParser.loadDataset(datasetPath)
+
+	assert list(dataset['sessionID']) == ['fixture'] * len(histories)
+	for history, (contrasts, frequencies, responses) in zip(histories, logParser.datasetHistories(dataset)):
+		assert numpy.array_equal(contrasts, history.contrasts)
+		assert numpy.array_equal(frequencies, history.frequencies)
+		assert numpy.array_equal(responses, numpy.array(history.responses, dtype=bool))
+
+	records = list(replay.replayMany(logParser.datasetHistories(dataset), stimulusSpace, processes=2, parameterSpace=PARAMETER_SPACE))
+	assert [record['history'] for record in records] == [0, 1]
+	for record, expected in zip(records, LIVE_RESULTS):
+		assert record['trials'] == 12
+		for name, value in expected.items():
+			assert numpy.isclose(record[name], value, rtol=1e-9), name
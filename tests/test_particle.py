@@ -0,0 +1,29 @@
+'''The particle filter estimator, against the grid estimator'''
+
+import numpy
+
+from QuickCSF import QuickCSF, ParticleCSF
+
+def test_particleEstimateMatchesGrid():
+	'''Both estimators given the same responses, to the stimuli the grid estimator selected'''
+	random = numpy.random.default_rng(0)
+	unmappedTrueParams = numpy.array([[18, 11, 12, 11]])
+
+	grid = QuickCSF.QuickCSFEstimator(randomSource=numpy.random.default_rng(1))
+	particles = ParticleCSF.ParticleCSFEstimator(randomSource=numpy.random.default_rng(2))
+
+	for trial in range(60):
+		stimulus = grid.next()
+		logSensitivity = QuickCSF.csf_unmapped(unmappedTrueParams, numpy.array([[stimulus.frequency]]))
+		response = random.random() < QuickCSF.psychometric(logSensitivity, stimulus.contrast, grid.d, grid.sig).item()
+
+		particles.markResponse(response, grid.currentStimulusIndex)
+		grid.markResponse(response)
+
+	assert particles.filterReport['resampleCount'] > 0
+	assert particles.filterReport['acceptanceRate'] > 0
+
+	gridSummary = grid.summarize()
+	particleSummary = particles.summarize()
+	for name in QuickCSF.PARAMETER_NAMES:
+		assert abs(particleSummary[name]['mean'] - gridSummary[name]['mean']) < gridSummary[name]['sd'] / 2
@@ -0,0 +1,48 @@
+'''Replaying stored histories, against the estimator which recorded them'''
+
+import numpy
+
+from QuickCSF import QuickCSF, replay
+
+PARAMETER_SPACE = QuickCSF.makeParameterSpace((8, 6, 5, 5))
+
+def recordSession(trialCount=30, seed=0):
+	'''A live session over a coarse grid, returning the estimator and its history as stored in a log'''
+	random = numpy.random.default_rng(seed)
+	unmappedTrueParams = numpy.array([[14, 10, 8, 6]])
+
+	estimator = QuickCSF.QuickCSFEstimator(parameterSpace=PARAMETER_SPACE, randomSource=numpy.random.default_rng(seed))
+	for trial in range(trialCount):
+		stimulus = estimator.next()
+		logSensitivity = QuickCSF.csf_unmapped(unmappedTrueParams, numpy.array([[stimulus.frequency]]))
+		estimator.markResponse(random.random() < QuickCSF.psychometric(logSensitivity, stimulus.contrast, estimator.d, estimator.sig).item())
+
+	contrasts, frequencies = numpy.array([stimulus for stimulus, response in estimator.responseHistory]).T
+	responses = numpy.array([response for stimulus, response in estimator.responseHistory])
+
+	return estimator, (contrasts, frequencies, responses)
+
+def assertResultsMatch(results, expected):
+	for name, value in expected.items():
+		assert numpy.allclose(results[name], value, rtol=1e-9), name
+
+def test_replayReproducesLiveResults():
+	estimator, history = recordSession()
+	expected = estimator.getResults()
+
+	assertResultsMatch(replay.replay(*history, estimator.stimulusSpace, parameterSpace=PARAMETER_SPACE).getResults(), expected)
+
+	records = list(replay.replayMany([history, history], estimator.stimulusSpace, processes=2, parameterSpace=PARAMETER_SPACE))
+	assert [record['history'] for record in records] == [0, 1]
+	for record in records:
+		assert record['trials'] == len(history[2])
+		assertResultsMatch(record, expected)
+
+def test_markResponsesMatchesMarkResponse():
+	estimator, history = recordSession(seed=1)
+
+	replayed = QuickCSF.QuickCSFEstimator(estimator.stimulusSpace, parameterSpace=PARAMETER_SPACE)
+	replayed.markResponses(*zip(*estimator.stimulusIndexHistory))
+
+	assert replayed.stimulusIndexHistory == estimator.stimulusIndexHistory
+	assert numpy.allclose(replayed.probabilities, estimator.probabilities, rtol=1e-9, atol=1e-300)
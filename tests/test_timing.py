@@ -0,0 +1,114 @@
+'''Presentation timing recorded by the 2AFC controller and main window, on the offscreen Qt platform'''
+
+import os
+
+import pytest
+
+os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+QtWidgets = pytest.importorskip('qtpy.QtWidgets')
+from qtpy import QtCore, QtTest
+
+from QuickCSF import CSFController, StimulusGenerators, timing, ui
+
+# Onsets are painted synchronously, so even a loaded machine should manage this
+MAX_ONSET_LATENCY = .05
+
+class SilentSound():
+	'''Stands in for a QSound, counting how often it was played'''
+
+	def __init__(self):
+		self.playCount = 0
+
+	def play(self):
+		self.playCount += 1
+
+@pytest.fixture(scope='module')
+def app():
+	return QtWidgets.QApplication.instance() or QtWidgets.QApplication([])
+
+def runSession(app, trialsPerBlock=2, blockCount=2):
+	'''Runs a session in a QuickCSFWindow, connected as in `app.main()`, pressing keys as soon as they are asked for
+
+		Returns:
+			the controller, the window, the stimulus onsets whose pixmap was prepared before the state began,
+			the generator snapshots emitted with each response, and the results shown when finished
+	'''
+
+	generator = StimulusGenerators.QuickCSFGenerator(size=20, orientationStep=90)
+	controller = CSFController.Controller_2AFC(
+		generator,
+		trialsPerBlock=trialsPerBlock, blockCount=blockCount,
+		fixationDuration=.02, stimulusDuration=.02, maskDuration=.02, interStimulusInterval=.02, feedbackDuration=.02
+	)
+
+	window = ui.QuickCSFWindow(sounds={name: SilentSound() for name in ['tone', 'good', 'bad']})
+	window.resize(200, 200)
+
+	# Connected before the window, so this sees the state of the window before it handles each transition
+	preparedOnsets = []
+	snapshots = []
+	finished = []
+	def onState(name, data):
+		if name.startswith('SHOW_STIMULUS') and (name == 'SHOW_STIMULUS_1') == data.stimulusOnFirst:
+			preparedOnsets.append(window._preparedStimulus is data.stimulus)
+
+		if name in ['INSTRUCTIONS', 'BREAKING', 'FINISHED']:
+			key = QtCore.Qt.Key_Space
+		elif name == 'WAIT_FOR_RESPONSE':
+			key = QtCore.Qt.Key_Left if data.stimulusOnFirst else QtCore.Qt.Key_Right
+		else:
+			key = None
+
+		if key is not None:
+			QtCore.QTimer.singleShot(0, lambda: QtTest.QTest.keyClick(window, key))
+
+		if name == 'FINISHED':
+			finished.append(data)
+
+	controller.stateTransition.connect(onState)
+	controller.responseMarked.connect(lambda trial, stimulusGenerator: snapshots.append(stimulusGenerator))
+
+	window.participantReady.connect(controller.onParticipantReady)
+	window.participantResponse.connect(controller.onParticipantResponse)
+	window.displayUpdated.connect(controller.onDisplayUpdated)
+	controller.stateTransition.connect(window.onNewState)
+
+	window.show()
+	QtCore.QTimer.singleShot(0, controller.start)
+	QtCore.QTimer.singleShot(60000, app.quit)
+	app.exec_()
+
+	assert finished, 'session did not finish in time'
+	return controller, window, preparedOnsets, snapshots, finished[0]
+
+def test_onsetLatenciesAreRecorded(app):
+	controller, window, preparedOnsets, snapshots, results = runSession(app)
+
+	timedStates = controller.getExpectedDurations()
+	for trial in controller.trials:
+		latencies = timing.onsetLatencies(trial)
+
+		for name in ['FIXATION_CROSS', 'SHOW_STIMULUS_1', 'SHOW_MASK_1', 'SHOW_STIMULUS_2', 'SHOW_MASK_2', 'FEEDBACK']:
+			assert name in latencies
+			assert 0 <= latencies[name] < MAX_ONSET_LATENCY
+
+		assert trial.timing['next'] is not None
+		assert trial.timing['markResponse'] is not None
+
+	summary = timing.summarize(controller.trials, timedStates)
+	for name in ['SHOW_STIMULUS_1', 'SHOW_STIMULUS_2']:
+		assert summary[name]['count'] == len(controller.trials)
+		assert summary[name]['onsetMax'] < MAX_ONSET_LATENCY * 1000
+
+	# Every stimulus was converted to a pixmap during its fixation, not at its onset
+	assert len(preparedOnsets) == len(controller.trials)
+	assert all(preparedOnsets)
+
+	# Two tones per trial, and feedback for every response
+	assert window.sounds['tone'].playCount == 2 * len(controller.trials)
+	assert window.sounds['good'].playCount + window.sounds['bad'].playCount == len(controller.trials)
+
+	# Results come from the snapshot of the last response, not the generator owned by the worker thread
+	assert len(snapshots) == len(controller.trials)
+	assert all(snapshot is not controller.stimulusGenerator for snapshot in snapshots)
+	assert results == snapshots[-1].getResults()